@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Dell EMC Inc.
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Benchmark the iDRAC class against the Redfish simulator in redfish_mock.py.
+#
+# Every scenario runs like one module invocation (a fresh iDRAC client) and
+# reports requests, wall time, p50/p99 latency and peak memory. The fleet
+# run drives --hosts clients through idrac_fleet.sweep(). With --check the
+# exit status is non-zero when a scenario needs more requests than its
+# budget, so round-trip regressions fail CI:
+#
+#   idrac_bench.py --latency 0.05 --repeat 5 --hosts 1000 --check
+#
+# The startup scenarios run one System command per transport in a fresh
+# interpreter, the way Ansible runs a module, and report the time spent
+# importing the module, the total time and the peak RSS of the process.
+# The handshake scenarios compare, per transport, the first connection of a
+# client to a host with a full TLS handshake and a later client's connection
+# that resumes the session, both with the certificate pinned. The memory
+# scenario reads the whole Lifecycle log as one page, as an $expand of a
+# large collection returns it, in a fresh interpreter so the simulator's
+# allocations don't count: parsed whole (response.json()) and streamed
+# entry by entry to log_dest.
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import tracemalloc
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+import idrac_fleet
+import redfish_mock
+
+SYSTEM_BATCH = ['Health', 'SerialNumber', 'ServiceTag', 'Manufacturer', 'BiosVersion', 'SystemType',
+                'PowerState', 'MemoryHealth', 'TotalSystemMemoryGiB', 'ProcessorCount',
+                'ProcessorHealth', 'ProcessorModel']
+
+
+def scenarios(args):
+    # name -> (subsystem, cmds, extra module params, request budget)
+    expand = not args.no_expand
+    log_pages = int(math.ceil(float(args.lclog) / args.page_size))
+    return [
+        ('system-batch', 'System', SYSTEM_BATCH, {}, 1),
+        ('chassis-batch', 'Chassis', ['Health', 'Model', 'PowerState', 'SKU', 'PartNumber'], {}, 1),
+        ('telemetry', 'Chassis', ['Telemetry'], {}, 2),
+        ('firmware', 'FW', ['FirmwareInventory'], {}, 2 if expand else 2 + args.firmware),
+        # service root, Storage, then per controller (PERC, BOSS, NVMe) the
+        # expanded Storage and Volumes, or every drive and volume without $expand
+        ('storage', 'System', ['StorageTopology'], {},
+         8 if expand else 2 + 3 + (args.drives + 4) + 3 + (max(1, args.drives // 2) + 1)),
+        ('lclog', 'Manager', ['LCLogs'], {'log_dest': os.path.join(args.workdir, 'lclog.ndjson')}, log_pages),
+    ]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(math.floor(k))
+    hi = int(math.ceil(k))
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+# Child process of the startup scenarios; prints its measurements as JSON
+STARTUP_CHILD = '''
+import sys, time, json, resource
+start = time.time()
+sys.path.insert(0, sys.argv[1])
+import idrac
+imported = time.time()
+module = idrac.StandaloneModule(idracip=sys.argv[2], subsystem='System', cmd=['Health'], transport=sys.argv[3])
+client = idrac.iDRAC(module)
+try:
+    idrac.run_commands(module, client, ['Health'])
+finally:
+    client.close()
+# ru_maxrss survives exec() and would report the parent's peak on Linux
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open('/proc/self/status') as f:
+        maxrss = int([l for l in f if l.startswith('VmHWM:')][0].split()[1])
+except (IOError, OSError, IndexError):
+    pass
+json.dump({'import': imported - start, 'total': time.time() - start,
+           'maxrss_kb': maxrss,
+           'modules': len(sys.modules), 'requests_loaded': 'requests' in sys.modules}, sys.stdout)
+'''
+
+
+# Child process of the memory scenario; prints its measurements as JSON
+MEMORY_CHILD = '''
+import sys, json, tracemalloc
+sys.path.insert(0, sys.argv[1])
+import idrac
+(address, mode, dest, entries) = sys.argv[2:6]
+module = idrac.StandaloneModule(idracip=address, subsystem='Manager', cmd=['LCLogs'], log_dest=dest,
+                                log_top=int(entries))
+client = idrac.iDRAC(module)
+tracemalloc.start()
+try:
+    if mode == 'stream':
+        idrac.run_commands(module, client, ['LCLogs'])
+    else:
+        client._get(client.manager_uri + '/Logs/Lclog?$top=' + entries, cache=False)
+finally:
+    client.close()
+json.dump({'peak': tracemalloc.get_traced_memory()[1], 'requests': client.request_count}, sys.stdout)
+'''
+
+
+def run_memory(server, entries, workdir):
+    library = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library')
+    address = '127.0.0.1:%d' % server.server_address[1]
+    result = {'scenario': 'lclog-page-memory', 'entries': entries}
+    for mode in ('decode', 'stream'):
+        server.reset_stats()
+        start = time.time()
+        out = subprocess.check_output([sys.executable, '-c', MEMORY_CHILD, library, address, mode,
+                                       os.path.join(workdir, 'memory-%s.ndjson' % mode), str(entries)],
+                                      stderr=open(os.devnull, 'w'))
+        run = json.loads(out.decode('utf-8'))
+        result['%s_peak_memory_kb' % mode] = run['peak'] // 1024
+        result['%s_wall' % mode] = round(time.time() - start, 3)
+        result['page_kb'] = server.stats['bytes'] // 1024
+    return result
+
+
+def run_startup(server, transport, repeat):
+    library = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library')
+    address = '127.0.0.1:%d' % server.server_address[1]
+    runs = []
+    for _ in range(repeat):
+        start = time.time()
+        out = subprocess.check_output([sys.executable, '-c', STARTUP_CHILD, library, address, transport],
+                                      stderr=open(os.devnull, 'w'))
+        run = json.loads(out.decode('utf-8'))
+        run['process'] = time.time() - start
+        runs.append(run)
+    return {'scenario': 'startup-' + transport,
+            'import_p50': round(percentile([r['import'] for r in runs], 50), 4),
+            'total_p50': round(percentile([r['total'] for r in runs], 50), 4),
+            'process_p50': round(percentile([r['process'] for r in runs], 50), 4),
+            'peak_rss_kb': max(r['maxrss_kb'] for r in runs),
+            'modules': runs[-1]['modules'],
+            'requests_imported': runs[-1]['requests_loaded']}
+
+
+def run_handshakes(server, transport, repeat, workdir):
+    # Every repeat uses a new pin store, and so a new TLS context without
+    # sessions: its first client does the full handshake and pins the
+    # certificate, the second one resumes and checks the pin
+    address = '127.0.0.1:%d' % server.server_address[1]
+    runs = {'full': [], 'resumed': []}
+    for i in range(repeat):
+        pin_dir = os.path.join(workdir, 'pins-%s-%d' % (transport, i))
+        for kind in ('full', 'resumed'):
+            start = time.time()
+            module = idrac.StandaloneModule(idracip=address, subsystem='System', cmd=['Health'], transport=transport,
+                                            pin_dir=pin_dir, timings=True)
+            client = idrac.iDRAC(module)
+            try:
+                idrac.run_commands(module, client, ['Health'])
+            finally:
+                client.close()
+            wall = time.time() - start
+            first = [t for t in client.timings if 'tls_resumed' in t][0]
+            runs[kind].append((first['tls'], first['tls_resumed'], wall))
+    result = {'scenario': 'handshake-' + transport}
+    for kind in ('full', 'resumed'):
+        result['%s_tls_ms_p50' % kind] = round(percentile([r[0] for r in runs[kind]], 50), 3)
+        result['%s_wall_p50' % kind] = round(percentile([r[2] for r in runs[kind]], 50), 4)
+        result['%s_resumed' % kind] = len([r for r in runs[kind] if r[1]])
+    return result
+
+
+def make_certificate(workdir):
+    cert = os.path.join(workdir, 'cert.pem')
+    key = os.path.join(workdir, 'key.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    return cert, key
+
+
+def run_scenario(server, name, subsystem, cmds, extra, budget, repeat):
+    walls = []
+    requests = []
+    peak = 0
+    server_requests = 0
+    for _ in range(repeat):
+        server.reset_stats()
+        tracemalloc.start()
+        start = time.time()
+        module = idrac.StandaloneModule(idracip='127.0.0.1:%d' % server.server_address[1], subsystem=subsystem, cmd=cmds, **extra)
+        client = idrac.iDRAC(module)
+        try:
+            idrac.run_commands(module, client, cmds)
+        finally:
+            client.close()
+        walls.append(time.time() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        requests.append(client.request_count)
+        server_requests = max(server_requests, server.stats['requests'])
+    return {'scenario': name,
+            'commands': len(cmds),
+            'requests': max(requests),
+            'server_requests': server_requests,
+            'budget': budget,
+            'wall_p50': round(percentile(walls, 50), 4),
+            'wall_p99': round(percentile(walls, 99), 4),
+            'peak_memory_kb': peak // 1024}
+
+
+def fleet_addresses(server, hosts):
+    # A distinct loopback address per simulated iDRAC, all reaching the one
+    # simulator, so the client's per-host request limit applies per host
+    port = server.server_address[1]
+    return ['127.%d.%d.%d:%d' % (i // 62500 % 250, i // 250 % 250, i % 250 + 1, port) for i in range(hosts)]
+
+
+def run_fleet(server, hosts, workers):
+    server.reset_stats()
+    groups = [('System', SYSTEM_BATCH), ('Chassis', ['Telemetry'])]
+    start = time.time()
+    records = idrac_fleet.sweep(fleet_addresses(server, hosts), groups, {}, workers)
+    wall = time.time() - start
+    elapsed = [r['elapsed'] for r in records]
+    return {'scenario': 'fleet',
+            'hosts': hosts,
+            'workers': workers,
+            'failed': len([r for r in records if 'error' in r]),
+            'requests': sum(r.get('requests', 0) for r in records),
+            'server_requests': server.stats['requests'],
+            'wall': round(wall, 3),
+            'host_p50': round(percentile(elapsed, 50), 4),
+            'host_p99': round(percentile(elapsed, 99), 4),
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the iDRAC module against a simulated iDRAC")
+    parser.add_argument('--certfile', help="certificate for the simulator; generated with openssl if unset")
+    parser.add_argument('--keyfile')
+    parser.add_argument('--repeat', type=int, default=5, help="runs per scenario")
+    parser.add_argument('--hosts', type=int, default=1000, help="fleet size, 0 to skip the fleet run")
+    parser.add_argument('--workers', type=int, default=64, help="fleet hosts in flight")
+    parser.add_argument('--check', action='store_true', help="fail when a scenario exceeds its request budget")
+    redfish_mock.add_fixture_arguments(parser)
+    parser.set_defaults(latency=0.05)
+    args = parser.parse_args()
+
+    idrac.disable_insecure_warnings()
+
+    args.workdir = tempfile.mkdtemp(prefix='idrac_bench')
+    try:
+        if not args.certfile:
+            args.certfile, args.keyfile = make_certificate(args.workdir)
+        # Listening on every address is what lets 127.x.y.z reach it
+        server = redfish_mock.server_from_args(args, ('0.0.0.0' if args.hosts else '127.0.0.1', 0)).start()
+        report = {'latency': args.latency, 'results': []}
+        failed = []
+        try:
+            for (name, subsystem, cmds, extra, budget) in scenarios(args):
+                result = run_scenario(server, name, subsystem, cmds, extra, budget, args.repeat)
+                report['results'].append(result)
+                if result['requests'] > budget:
+                    failed.append(name)
+            for transport in ('requests', 'http.client'):
+                report['results'].append(run_startup(server, transport, args.repeat))
+            report['results'].append(run_memory(server, args.lclog, args.workdir))
+            for transport in ('requests', 'http.client'):
+                report['results'].append(run_handshakes(server, transport, args.repeat, args.workdir))
+            if args.hosts:
+                report['results'].append(run_fleet(server, args.hosts, args.workers))
+        finally:
+            server.stop()
+        report['over_budget'] = failed
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        if args.check and failed:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Dell EMC Inc.
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Long running event collector for one iDRAC.
+#
+# Events are taken, in order of preference, from:
+#   - the EventService ServerSentEventUri stream (sse)
+#   - a push subscription delivering to a local HTTP listener (push)
+#   - polling PowerState and health, backing off while nothing changes (poll)
+# A stream the iDRAC closes or breaks is reopened after the last event id
+# seen; in auto mode, once it keeps failing, push and then poll take over.
+# Every event or state change is written to stdout as one JSON line.
+#
+#   idrac_events.py 10.0.0.5 --listen 0.0.0.0:8188 \
+#       --destination https://collector.example.com:8188/events
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+
+
+def emit(host, source, event):
+    sys.stdout.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                                 'host': host,
+                                 'source': source,
+                                 'event': event}, sort_keys=True) + '\n')
+    sys.stdout.flush()
+
+
+def split_events(payload):
+    # A Redfish Event carries its records in Events[]; anything else is
+    # passed through as is
+    if isinstance(payload, dict) and isinstance(payload.get('Events'), list):
+        return payload['Events']
+    return [payload]
+
+
+def run_sse(client, host, uri, min_delay, max_delay, attempts=0):
+    # Reconnect whenever the iDRAC closes the stream or it breaks, resuming
+    # after the last event id seen, and double the delay while reconnects
+    # bring no events. With attempts, give up after that many reconnects in
+    # a row without an event so the caller can fall back to another mode
+    state = {}
+    failures = 0
+    delay = min_delay
+    while True:
+        reason = "event stream closed"
+        try:
+            for payload in client.iter_sse_events(uri, state):
+                failures = 0
+                delay = min_delay
+                for event in split_events(payload):
+                    emit(host, 'sse', event)
+        except (idrac.iDRACError, client.errors) as e:
+            reason = "event stream failed: %s" % e
+        failures += 1
+        if attempts and failures >= attempts:
+            raise idrac.iDRACError(reason)
+        emit(host, 'sse', {'warning': "%s, reconnecting in %gs" % (reason, delay)})
+        time.sleep(delay)
+        delay = min(max_delay, delay * 2)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_listener(listen, events, certfile=None, keyfile=None):
+    # HTTP(S) endpoint the iDRAC POSTs subscribed events to
+    class EventHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            try:
+                events.put(json.loads(body.decode('utf-8')))
+            except ValueError:
+                events.put({'Message': body.decode('utf-8', 'replace')})
+
+    host, _, port = listen.rpartition(':')
+    server = ThreadingHTTPServer((host or '0.0.0.0', int(port)), EventHandler)
+    if certfile:
+        import ssl
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def run_push(client, host, args):
+    events = queue.Queue()
+    server = make_listener(args.listen, events, args.certfile, args.keyfile)
+    subscription = None
+    try:
+        subscription = client.create_event_subscription(args.destination, args.event_types, context='idrac_events')
+        while True:
+            payload = events.get()
+            for event in split_events(payload):
+                emit(host, 'push', event)
+    finally:
+        if subscription:
+            client.delete_event_subscription(subscription)
+        server.shutdown()
+
+
+def poll_state(client):
+    (system, chassis) = client.fetch_resources([client.system_uri, client.chassis_uri], cache=False)
+    return {'PowerState': system.get(u'PowerState'),
+            'SystemHealth': (system.get(u'Status') or {}).get(u'Health'),
+            'SystemHealthRollup': (system.get(u'Status') or {}).get(u'HealthRollup'),
+            'ChassisHealth': (chassis.get(u'Status') or {}).get(u'Health')}
+
+
+def run_poll(client, host, min_interval, max_interval):
+    # Poll fast right after a change or an error clears, then double the
+    # interval up to max_interval while the state stays the same
+    last = None
+    interval = min_interval
+    while True:
+        try:
+            state = poll_state(client)
+        except Exception as e:
+            emit(host, 'poll', {'error': "%s: %s" % (type(e).__name__, e)})
+            interval = min(max_interval, interval * 2)
+        else:
+            if state != last:
+                changes = dict((k, v) for k, v in state.items() if last is None or last.get(k) != v)
+                emit(host, 'poll', changes)
+                last = state
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * 2)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream iDRAC events as JSON lines")
+    parser.add_argument('host', help="iDRAC address")
+    parser.add_argument('--user', default=os.environ.get('IDRAC_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('IDRAC_PASSWORD', 'calvin'))
+    parser.add_argument('--mode', default='auto', choices=['auto', 'sse', 'push', 'poll'])
+    parser.add_argument('--listen', help="HOST:PORT for push subscriptions")
+    parser.add_argument('--destination', help="URL the iDRAC posts to, reaching --listen")
+    parser.add_argument('--certfile', help="serve the listener over HTTPS with this certificate")
+    parser.add_argument('--keyfile')
+    parser.add_argument('--event-types', nargs='*', default=['Alert'],
+                        help="EventTypes to subscribe to")
+    parser.add_argument('--transport', default='requests', choices=['requests', 'http.client'])
+    parser.add_argument('--poll-min', type=float, default=5.0, help="seconds")
+    parser.add_argument('--poll-max', type=float, default=300.0, help="seconds")
+    parser.add_argument('--reconnect-min', type=float, default=1.0, help="seconds before reopening the event stream")
+    parser.add_argument('--reconnect-max', type=float, default=60.0, help="seconds")
+    parser.add_argument('--sse-attempts', type=int, default=3,
+                        help="in auto mode, fall back after this many event stream failures in a row")
+    args = parser.parse_args()
+
+    if args.listen and not args.destination:
+        scheme = 'https' if args.certfile else 'http'
+        args.destination = '%s://%s/' % (scheme, args.listen)
+    if args.mode == 'push' and not args.listen:
+        parser.error("--mode push needs --listen")
+
+    if args.transport == 'requests':
+        idrac.disable_insecure_warnings()
+    # Let SIGTERM unwind through the finally blocks that remove the
+    # subscription and the Redfish session
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))
+
+    module = idrac.StandaloneModule(idracip=args.host, idracuser=args.user, idracpswd=args.password,
+                                    auth_mode='session', transport=args.transport)
+    client = idrac.iDRAC(module)
+    try:
+        if args.mode == 'sse':
+            sse_uri = client.get_event_sse_uri()
+            if not sse_uri:
+                parser.error("this iDRAC has no ServerSentEventUri")
+            run_sse(client, args.host, sse_uri, args.reconnect_min, args.reconnect_max)
+        elif args.mode == 'push':
+            run_push(client, args.host, args)
+        elif args.mode == 'poll':
+            run_poll(client, args.host, args.poll_min, args.poll_max)
+        else:
+            # Best mode first, falling back to push and then to polling
+            # when it fails
+            fallback = 'push' if args.listen else 'poll'
+            try:
+                sse_uri = client.get_event_sse_uri()
+                if sse_uri:
+                    run_sse(client, args.host, sse_uri, args.reconnect_min, args.reconnect_max,
+                            args.sse_attempts)
+            except (idrac.iDRACError, client.errors) as e:
+                emit(args.host, fallback, {'warning': "%s, falling back to %s" % (e, fallback)})
+            if args.listen:
+                try:
+                    run_push(client, args.host, args)
+                except (idrac.iDRACError, client.errors) as e:
+                    emit(args.host, 'poll', {'warning': "push subscription failed, polling: %s" % e})
+            run_poll(client, args.host, args.poll_min, args.poll_max)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
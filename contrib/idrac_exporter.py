@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Dell EMC Inc.
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Prometheus exporter for the health and sensors of many iDRACs.
+#
+# Every target keeps one iDRAC client, with its Redfish session and
+# keep-alive connections, and is refreshed in the background every
+# --interval seconds by at most --workers threads. /metrics serves the
+# samples of the last refresh from memory, so a scrape never waits for a
+# BMC and the BMCs see the same load however often they are scraped:
+#
+#   idrac_exporter.py --hosts-file idracs.txt --interval 60 --listen 0.0.0.0:9348
+#
+# /metrics?target=HOST returns the samples of one target. A target still
+# being refreshed when it is due again skips that round.
+
+import os
+import sys
+import gzip
+import time
+import heapq
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+import idrac_fleet
+
+# Commands of one refresh: a $select'ed GET of the System, Chassis and
+# Manager resources plus the Thermal and Power aggregates
+COLLECT = [('System', ['Health', 'PowerState', 'MemoryHealth', 'ProcessorHealth']),
+           ('Chassis', ['Health', 'Telemetry']),
+           ('Manager', ['Health'])]
+
+HEALTH = {'OK': 0, 'Warning': 1, 'Critical': 2}
+
+# Metric families in the order they are served: (name, type, help)
+FAMILIES = [
+    ('idrac_up', 'gauge', "1 when the last refresh of the target succeeded"),
+    ('idrac_health', 'gauge', "Status.Health of a component: 0 OK, 1 Warning, 2 Critical"),
+    ('idrac_power_on', 'gauge', "1 when the system's PowerState is On"),
+    ('idrac_temperature_celsius', 'gauge', "Temperature sensor reading"),
+    ('idrac_temperature_upper_critical_celsius', 'gauge', "Upper critical threshold of a temperature sensor"),
+    ('idrac_fan_reading', 'gauge', "Fan reading in the units of the units label"),
+    ('idrac_power_consumed_watts', 'gauge', "Power consumed, per power control"),
+    ('idrac_power_capacity_watts', 'gauge', "Power capacity, per power control"),
+    ('idrac_power_average_watts', 'gauge', "Average power consumed over the iDRAC's metrics interval"),
+    ('idrac_power_min_watts', 'gauge', "Minimum power consumed over the iDRAC's metrics interval"),
+    ('idrac_power_max_watts', 'gauge', "Maximum power consumed over the iDRAC's metrics interval"),
+    ('idrac_psu_input_watts', 'gauge', "Power supply input"),
+    ('idrac_psu_output_watts', 'gauge', "Power supply output"),
+    ('idrac_psu_line_input_volts', 'gauge', "Power supply line input voltage"),
+    ('idrac_voltage_volts', 'gauge', "Voltage sensor reading"),
+    ('idrac_sensor_health', 'gauge', "Health of a temperature, fan, power supply or voltage sensor: "
+                                     "0 OK, 1 Warning, 2 Critical"),
+    ('idrac_refresh_duration_seconds', 'gauge', "Duration of the last refresh"),
+    ('idrac_refresh_requests', 'gauge', "Redfish requests of the last refresh"),
+    ('idrac_last_refresh_timestamp_seconds', 'gauge', "Time of the last successful refresh"),
+    ('idrac_refresh_failures', 'counter', "Failed refreshes since the exporter started"),
+    ('idrac_refresh_skipped', 'counter', "Refreshes skipped while the previous one was still running"),
+]
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def target_samples(host, results):
+    # (family, labels, value) of one refresh's structured results
+    samples = []
+
+    def add(family, value, *labels):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            samples.append((family, (('target', host),) + labels, value))
+
+    system = results.get('System') or {}
+    chassis = results.get('Chassis') or {}
+    add('idrac_health', HEALTH.get(system.get('Health')), ('component', 'system'))
+    add('idrac_health', HEALTH.get(system.get('MemoryHealth')), ('component', 'memory'))
+    add('idrac_health', HEALTH.get(system.get('ProcessorHealth')), ('component', 'processor'))
+    add('idrac_health', HEALTH.get(chassis.get('Health')), ('component', 'chassis'))
+    add('idrac_health', HEALTH.get((results.get('Manager') or {}).get('Health')), ('component', 'manager'))
+    if system.get('PowerState') is not None:
+        add('idrac_power_on', system['PowerState'] == 'On')
+    telemetry = chassis.get('Telemetry') or {}
+    for i in telemetry.get('temperatures', []):
+        add('idrac_temperature_celsius', i['reading_celsius'], ('sensor', i['name']))
+        add('idrac_temperature_upper_critical_celsius', i['upper_critical'], ('sensor', i['name']))
+        add('idrac_sensor_health', HEALTH.get(i['health']), ('kind', 'temperature'), ('sensor', i['name']))
+    for i in telemetry.get('fans', []):
+        add('idrac_fan_reading', i['reading'], ('sensor', i['name']), ('units', i['units'] or ''))
+        add('idrac_sensor_health', HEALTH.get(i['health']), ('kind', 'fan'), ('sensor', i['name']))
+    for i in telemetry.get('power_control', []):
+        for (key, family) in (('consumed_watts', 'idrac_power_consumed_watts'),
+                              ('capacity_watts', 'idrac_power_capacity_watts'),
+                              ('average_watts', 'idrac_power_average_watts'),
+                              ('min_watts', 'idrac_power_min_watts'),
+                              ('max_watts', 'idrac_power_max_watts')):
+            add(family, i[key], ('control', i['name']))
+    for i in telemetry.get('power_supplies', []):
+        add('idrac_psu_input_watts', i['input_watts'], ('psu', i['name']))
+        add('idrac_psu_output_watts', i['output_watts'], ('psu', i['name']))
+        add('idrac_psu_line_input_volts', i['line_input_voltage'], ('psu', i['name']))
+        add('idrac_sensor_health', HEALTH.get(i['health']), ('kind', 'psu'), ('sensor', i['name']))
+    for i in telemetry.get('voltages', []):
+        add('idrac_voltage_volts', i['reading_volts'], ('sensor', i['name']))
+        add('idrac_sensor_health', HEALTH.get(i['health']), ('kind', 'voltage'), ('sensor', i['name']))
+    return samples
+
+
+class Target(object):
+    # One iDRAC: its client, the samples of its last good refresh and the
+    # refresh counters. lock guards what scrapes read.
+    def __init__(self, host, params, max_age):
+        self.host = host
+        self.module = idrac.StandaloneModule(idracip=host, subsystem=COLLECT[0][0], cmd=COLLECT[0][1], **params)
+        self.client = None
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.running = False
+        self.up = None
+        self.samples = []
+        self.refreshed = None
+        self.duration = None
+        self.requests = None
+        self.failures = 0
+        self.skipped = 0
+
+    def refresh(self):
+        start = time.time()
+        requests = 0
+        try:
+            if self.client is None:
+                self.client = idrac.iDRAC(self.module)
+                # Read once, so that every refresh can use $select
+                self.client.get_protocol_features()
+            self.client.forget_resources()
+            requests = self.client.request_count
+            results = {}
+            for (subsystem, cmds) in COLLECT:
+                self.module.params['subsystem'] = subsystem
+                self.module.params['cmd'] = cmds
+                results[subsystem] = idrac.run_commands(self.module, self.client, cmds)[1]
+            samples = target_samples(self.host, results)
+        except Exception as e:
+            samples = None
+            sys.stderr.write("%s: refresh failed: %s: %s\n" % (self.host, type(e).__name__, e))
+        with self.lock:
+            self.running = False
+            self.duration = time.time() - start
+            if self.client is not None:
+                self.requests = self.client.request_count - requests
+            if samples is None:
+                self.up = 0
+                self.failures += 1
+            else:
+                self.up = 1
+                self.samples = samples
+                self.refreshed = time.time()
+
+    def metrics(self):
+        # Samples for a scrape; the sensor readings only while they are
+        # younger than max_age, so a BMC that stopped answering doesn't
+        # keep reporting its last temperatures forever
+        labels = (('target', self.host),)
+        with self.lock:
+            if self.up is None:
+                return []
+            samples = [('idrac_up', labels, self.up),
+                       ('idrac_refresh_failures', labels, self.failures),
+                       ('idrac_refresh_skipped', labels, self.skipped)]
+            if self.duration is not None:
+                samples.append(('idrac_refresh_duration_seconds', labels, round(self.duration, 3)))
+            if self.requests is not None:
+                samples.append(('idrac_refresh_requests', labels, self.requests))
+            if self.refreshed is not None:
+                samples.append(('idrac_last_refresh_timestamp_seconds', labels, round(self.refreshed, 3)))
+                if time.time() - self.refreshed <= self.max_age:
+                    samples.extend(self.samples)
+            return samples
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+def render(targets, openmetrics=False):
+    # Prometheus text format, or OpenMetrics, with the samples of every
+    # target grouped by family as both formats require
+    by_family = {}
+    for target in targets:
+        for (family, labels, value) in target.metrics():
+            by_family.setdefault(family, []).append((labels, value))
+    lines = []
+    for (family, kind, text) in FAMILIES:
+        if family not in by_family:
+            continue
+        name = family + '_total' if kind == 'counter' else family
+        lines.append('# HELP %s %s' % (family if openmetrics else name, text))
+        lines.append('# TYPE %s %s' % (family if openmetrics else name, kind))
+        for (labels, value) in by_family[family]:
+            lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (k, escape(v)) for (k, v) in labels), value))
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def refresh_loop(targets, interval, workers, stop):
+    # Every target is due once per interval. The first round is spread over
+    # the first interval so that the BMCs aren't all read at the same moment.
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets))))
+    due = [(time.time() + interval * i / float(len(targets)), i) for i in range(len(targets))]
+    heapq.heapify(due)
+    try:
+        while not stop.is_set():
+            (when, i) = due[0]
+            if stop.wait(max(0, when - time.time())):
+                break
+            heapq.heapreplace(due, (when + interval, i))
+            target = targets[i]
+            with target.lock:
+                if target.running:
+                    target.skipped += 1
+                    continue
+                target.running = True
+            pool.submit(target.refresh)
+    finally:
+        pool.shutdown()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(listen, targets):
+    by_host = dict((t.host, t) for t in targets)
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body, content_type='text/plain; charset=utf-8'):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/metrics':
+                return self.reply(404, "Not found, see /metrics\n")
+            selected = targets
+            names = parse_qs(url.query).get('target')
+            if names:
+                selected = [by_host[name] for name in names if name in by_host]
+                if not selected:
+                    return self.reply(404, "Unknown target %s\n" % ', '.join(names))
+            if 'application/openmetrics-text' in (self.headers.get('Accept') or ''):
+                return self.reply(200, render(selected, True),
+                                  'application/openmetrics-text; version=1.0.0; charset=utf-8')
+            return self.reply(200, render(selected), 'text/plain; version=0.0.4; charset=utf-8')
+
+    host, _, port = listen.rpartition(':')
+    return ThreadingHTTPServer((host or '0.0.0.0', int(port)), MetricsHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve iDRAC health and sensors as Prometheus metrics")
+    parser.add_argument('hosts', nargs='*', help="iDRAC addresses")
+    parser.add_argument('--hosts-file', help="file with one iDRAC address per line")
+    parser.add_argument('--listen', default='0.0.0.0:9348', help="HOST:PORT to serve /metrics on")
+    parser.add_argument('--interval', type=float, default=60, help="seconds between refreshes of a target")
+    parser.add_argument('--max-age', type=float, default=None,
+                        help="seconds after which the readings of a failing target are dropped, "
+                             "default three intervals")
+    parser.add_argument('--workers', type=int, default=32, help="targets refreshed at the same time")
+    parser.add_argument('--user', default=os.environ.get('IDRAC_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('IDRAC_PASSWORD', 'calvin'))
+    parser.add_argument('--auth-mode', default='session', choices=['basic', 'session'])
+    parser.add_argument('--max-concurrency', type=int, default=2, help="requests in flight per iDRAC")
+    parser.add_argument('--read-timeout', type=float, default=30, help="seconds before a hung iDRAC is given up")
+    parser.add_argument('--retries', type=int, default=1, help="extra attempts on throttling and server errors")
+    parser.add_argument('--transport', default='requests', choices=['requests', 'http.client'])
+    parser.add_argument('--pin-dir',
+                        help="pin every iDRAC's certificate on first use and refuse a different one afterwards")
+    args = parser.parse_args()
+
+    hosts = idrac_fleet.read_hosts(args)
+    if not hosts:
+        parser.error("no hosts given")
+
+    if args.transport == 'requests':
+        idrac.disable_insecure_warnings()
+    # Let SIGTERM unwind through the finally block that closes the Redfish
+    # sessions
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))
+
+    params = dict(idracuser=args.user,
+                  idracpswd=args.password,
+                  auth_mode=args.auth_mode,
+                  max_concurrency=args.max_concurrency,
+                  read_timeout=args.read_timeout,
+                  retries=args.retries,
+                  transport=args.transport,
+                  pin_dir=args.pin_dir,
+                  output='structured')
+    targets = [Target(host, params, args.max_age or 3 * args.interval) for host in hosts]
+    stop = threading.Event()
+    loop = threading.Thread(target=refresh_loop, args=(targets, args.interval, args.workers, stop))
+    loop.daemon = True
+    loop.start()
+    server = make_server(args.listen, targets)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        loop.join()
+        server.server_close()
+        for target in targets:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Dell EMC Inc.
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Collect iDRAC fields from a whole fleet in one process.
+#
+# Every host is handled by a worker thread that drives the iDRAC class from
+# library/idrac.py directly, so there is no per-host module shipping or
+# Python start up. Example:
+#
+#   idrac_fleet.py --hosts-file idracs.txt --collect System:Health,SerialNumber \
+#       --collect Chassis:Model --workers 128 --format ndjson -o inventory.ndjson
+#
+# --reset runs a rolling power action instead: hosts are reset in waves of
+# --wave-size, at most --max-in-flight at a time, each host polled until its
+# PowerState shows the result, and the rollout stops when a wave's failure
+# rate exceeds --max-failure-rate:
+#
+#   idrac_fleet.py --hosts-file rack12.txt --reset GracefulRestart \
+#       --wave-size 20 --max-in-flight 10 --wave-delay 60
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+
+
+def parse_collect(values):
+    # "System:Health,SerialNumber" -> [('System', ['Health', 'SerialNumber'])]
+    groups = []
+    for value in values:
+        subsystem, _, cmds = value.partition(':')
+        if not cmds:
+            raise argparse.ArgumentTypeError("--collect expects SUBSYSTEM:CMD[,CMD...], got %s" % value)
+        groups.append((subsystem, [c.strip() for c in cmds.split(',') if c.strip()]))
+    return groups
+
+
+def read_hosts(args):
+    hosts = list(args.hosts)
+    if args.hosts_file:
+        with open(args.hosts_file) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    hosts.append(line)
+    return hosts
+
+
+def module_params(args):
+    # Module options shared by every host
+    return dict(idracuser=args.user,
+                idracpswd=args.password,
+                auth_mode=args.auth_mode,
+                max_concurrency=args.max_concurrency,
+                cache_dir=args.cache_dir,
+                read_timeout=args.read_timeout,
+                retries=args.retries,
+                baseline=args.baseline,
+                all_members=args.all_members,
+                output='structured' if args.structured else 'text',
+                snapshot_dir=args.snapshot_dir,
+                transport=args.transport,
+                pin_dir=args.pin_dir,
+                timings=args.timings,
+                trace_file=args.trace_file)
+
+
+def collect_host(host, groups, params):
+    record = {'host': host, 'data': {}}
+    start = time.time()
+    module = idrac.StandaloneModule(idracip=host, cmd=groups[0][1], **params)
+    client = None
+    try:
+        client = idrac.iDRAC(module)
+        for (subsystem, cmds) in groups:
+            module.params['subsystem'] = subsystem
+            module.params['cmd'] = cmds
+            (changed, outs, errs) = idrac.run_commands(module, client, cmds)
+            if params.get('snapshot_dir'):
+                (delta, outs) = idrac.report_changes(module, outs, errs)
+                record['changed'] = record.get('changed', False) or delta
+            record['data'][subsystem] = outs
+            if errs:
+                record.setdefault('errors', {})[subsystem] = errs
+    except Exception as e:
+        record['error'] = "%s: %s" % (type(e).__name__, e)
+    finally:
+        if client is not None:
+            client.close()
+            record['requests'] = client.request_count
+            if params.get('timings'):
+                record['timings'] = client.timings
+    record['elapsed'] = round(time.time() - start, 3)
+    return record
+
+
+def run_hosts(func, hosts, workers, emit=None):
+    # func(host) for every host with at most `workers` hosts in flight.
+    # emit() is called with each record as soon as its host finishes.
+    records = []
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts))))
+    try:
+        futures = [pool.submit(func, host) for host in hosts]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            if emit is not None:
+                emit(record)
+    finally:
+        pool.shutdown()
+    return records
+
+
+def sweep(hosts, groups, params, workers, emit=None):
+    # Collect from every host with at most `workers` hosts in flight
+    return run_hosts(lambda host: collect_host(host, groups, params), hosts, workers, emit)
+
+
+# ResetType -> PowerState that confirms it; a restart must also be seen
+# leaving On or change LastResetTime. PushPowerButton toggles and Nmi
+# doesn't change power.
+RESET_STATES = {'On': 'On', 'ForceOff': 'Off', 'GracefulShutdown': 'Off', 'GracefulRestart': 'On'}
+RESTARTS = ('GracefulRestart',)
+
+
+def power_state(client):
+    # (PowerState, LastResetTime), the latter None on firmware without it
+    uri = client.system_uri
+    if client.supports_select():
+        uri += '?$select=PowerState,LastResetTime'
+    system = client.check_response(uri, client.fetch_resources([uri], cache=False)[0])
+    return (system.get(u'PowerState'), system.get(u'LastResetTime'))
+
+
+def reset_host(host, reset_type, params, timeout, poll_interval):
+    # Reset one host and poll until PowerState confirms it. A host already
+    # in the requested On or Off state is left alone, with changed false.
+    # A restart too quick to be seen leaving On, with no LastResetTime to
+    # show it either, counts as done once the timeout runs out, since the
+    # iDRAC accepted the reset.
+    record = {'host': host, 'reset': reset_type}
+    start = time.time()
+    module = idrac.StandaloneModule(idracip=host, subsystem='System', cmd=['Reset'], ResetType=reset_type, **params)
+    client = None
+    try:
+        client = idrac.iDRAC(module)
+        (state, reset_time) = power_state(client)
+        record['before'] = state
+        target = RESET_STATES.get(reset_type)
+        if reset_type == 'PushPowerButton':
+            target = 'Off' if state == 'On' else 'On'
+        record['changed'] = target != state or reset_type in RESTARTS
+        if record['changed']:
+            (changed, outs, errs) = idrac.run_commands(module, client, ['Reset'])
+            if errs:
+                raise idrac.iDRACError(errs['Reset'])
+            record['posted'] = round(time.time() - start, 3)
+            left = False
+            while target is not None:
+                (state, last_reset) = power_state(client)
+                left = left or state != 'On' or (reset_time is not None and last_reset != reset_time)
+                if state == target and (left or reset_type not in RESTARTS):
+                    record['confirmed'] = round(time.time() - start, 3)
+                    break
+                if time.time() - start > timeout:
+                    if state == target:
+                        record['unconfirmed'] = "restart accepted, PowerState never seen leaving On"
+                        break
+                    raise idrac.iDRACError("PowerState still %s after %ds" % (state, timeout))
+                time.sleep(poll_interval)
+        record['after'] = state
+    except Exception as e:
+        record['error'] = "%s: %s" % (type(e).__name__, e)
+    finally:
+        if client is not None:
+            client.close()
+            record['requests'] = client.request_count
+    record['elapsed'] = round(time.time() - start, 3)
+    return record
+
+
+def power_waves(hosts, reset_type, params, wave_size, max_in_flight, wave_delay, max_failure_rate,
+                timeout, poll_interval, emit=None):
+    # Reset hosts wave by wave, in the given order, waiting wave_delay
+    # between waves. Once a wave fails on more than max_failure_rate of
+    # its hosts the remaining hosts are skipped.
+    records = []
+    waves = []
+    for first in range(0, len(hosts), wave_size):
+        wave = hosts[first:first + wave_size]
+        if waves:
+            time.sleep(wave_delay)
+        start = time.time()
+        done = run_hosts(lambda host: reset_host(host, reset_type, params, timeout, poll_interval),
+                         wave, max_in_flight, emit)
+        records.extend(done)
+        failed = len([r for r in done if 'error' in r])
+        waves.append({'wave': len(waves) + 1, 'hosts': len(wave), 'failed': failed,
+                      'elapsed': round(time.time() - start, 3)})
+        if failed > max_failure_rate * len(wave):
+            for host in hosts[first + wave_size:]:
+                record = {'host': host, 'reset': reset_type, 'skipped': "rollout stopped after wave %d" % len(waves)}
+                records.append(record)
+                if emit is not None:
+                    emit(record)
+            break
+    return (records, waves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect iDRAC fields from many hosts concurrently")
+    parser.add_argument('hosts', nargs='*', help="iDRAC addresses")
+    parser.add_argument('--hosts-file', help="file with one iDRAC address per line")
+    parser.add_argument('--collect', action='append', metavar='SUBSYSTEM:CMD[,CMD...]',
+                        help="commands to run, may be given several times")
+    parser.add_argument('--reset', choices=['On', 'ForceOff', 'GracefulRestart', 'GracefulShutdown',
+                                            'PushPowerButton', 'Nmi'],
+                        help="reset the hosts' systems in waves instead of collecting")
+    parser.add_argument('--wave-size', type=int, default=10, help="hosts per reset wave")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="hosts of a wave reset at the same time, default the wave size")
+    parser.add_argument('--wave-delay', type=float, default=30, help="seconds between waves")
+    parser.add_argument('--max-failure-rate', type=float, default=0.1,
+                        help="stop the rollout when more than this fraction of a wave fails")
+    parser.add_argument('--power-timeout', type=float, default=900,
+                        help="seconds a host may take to reach the new PowerState")
+    parser.add_argument('--poll-interval', type=float, default=5, help="seconds between PowerState polls")
+    parser.add_argument('--user', default=os.environ.get('IDRAC_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('IDRAC_PASSWORD', 'calvin'))
+    parser.add_argument('--auth-mode', default='session', choices=['basic', 'session'])
+    parser.add_argument('--workers', type=int, default=64, help="hosts handled at the same time")
+    parser.add_argument('--max-concurrency', type=int, default=4, help="requests in flight per iDRAC")
+    parser.add_argument('--read-timeout', type=float, default=60, help="seconds before a hung iDRAC is given up")
+    parser.add_argument('--retries', type=int, default=3, help="extra attempts on throttling and server errors")
+    parser.add_argument('--transport', default='requests', choices=['requests', 'http.client'])
+    parser.add_argument('--pin-dir',
+                        help="pin every iDRAC's certificate on first use and refuse a different one afterwards")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--structured', action='store_true',
+                        help="native values without @odata annotations instead of the module's strings")
+    parser.add_argument('--snapshot-dir',
+                        help="report only the results that changed since the previous sweep")
+    parser.add_argument('--all-members', action='store_true',
+                        help="collect from every System/Chassis/Manager member, e.g. all sleds of a chassis")
+    parser.add_argument('--baseline', help="Catalog.xml or JSON baseline for FW:Compliance")
+    parser.add_argument('--timings', action='store_true', help="add per request timings to every host record")
+    parser.add_argument('--trace-file', help="append OTLP/JSON spans of every host's requests to this file")
+    parser.add_argument('--format', default='json', choices=['json', 'ndjson'])
+    parser.add_argument('-o', '--output', default='-')
+    args = parser.parse_args()
+
+    if not args.collect and not args.reset:
+        parser.error("one of --collect or --reset is required")
+    hosts = read_hosts(args)
+    if not hosts:
+        parser.error("no hosts given")
+
+    if args.transport == 'requests':
+        idrac.disable_insecure_warnings()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    def emit(record):
+        out.write(json.dumps(record, sort_keys=True) + '\n')
+        out.flush()
+
+    start = time.time()
+    report = {}
+    if args.reset:
+        (records, report['waves']) = power_waves(hosts, args.reset, module_params(args), max(1, args.wave_size),
+                                                 args.max_in_flight or args.wave_size, args.wave_delay,
+                                                 args.max_failure_rate, args.power_timeout, args.poll_interval,
+                                                 emit if args.format == 'ndjson' else None)
+    else:
+        records = sweep(hosts, parse_collect(args.collect), module_params(args), args.workers,
+                        emit if args.format == 'ndjson' else None)
+    if args.format == 'json':
+        failed = [r for r in records if 'error' in r]
+        report['hosts'] = sorted(records, key=lambda r: r['host'])
+        report['summary'] = {'hosts': len(records),
+                             'failed': len(failed),
+                             'elapsed': round(time.time() - start, 3)}
+        if args.reset:
+            report['summary']['skipped'] = len([r for r in records if 'skipped' in r])
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.write('\n')
+    elif args.reset:
+        out.write(json.dumps({'waves': report['waves']}, sort_keys=True) + '\n')
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,687 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# (c) 2017, Dell EMC Inc.
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Local iDRAC Redfish simulator for measuring the module without hardware.
+#
+# It serves the resources the iDRAC class reads, with configurable latency,
+# a concurrent request limit (503 beyond it), random 429 throttling and
+# fixture sizes, and counts every request it answers:
+#
+#   redfish_mock.py --port 8443 --certfile cert.pem --keyfile key.pem \
+#       --latency 0.5 --max-concurrent 4 --firmware 35 --lclog 5000
+#
+# GET /mock/stats returns the request counters, DELETE /mock/stats resets them.
+# The EventService's ServerSentEventUri streams a simulated event every
+# --sse-interval seconds, numbered on from the Last-Event-ID of a reconnect.
+
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+
+ROOT = '/redfish/v1'
+SYSTEM = ROOT + '/Systems/System.Embedded.1'
+CHASSIS = ROOT + '/Chassis/System.Embedded.1'
+MANAGER = ROOT + '/Managers/iDRAC.Embedded.1'
+FIRMWARE = ROOT + '/UpdateService/FirmwareInventory'
+
+
+def collection(uri, members):
+    return {'@odata.id': uri,
+            'Members': [{'@odata.id': m} for m in members],
+            'Members@odata.count': len(members)}
+
+
+def is_link(value):
+    return isinstance(value, dict) and list(value) == ['@odata.id']
+
+
+def log_entry(log, i):
+    return {'@odata.id': '%s/Logs/%s/%d' % (MANAGER, log, i),
+            'Id': str(i),
+            'Created': time.strftime('%Y-%m-%dT%H:%M:%S-00:00', time.gmtime(1500000000 + i * 60)),
+            'EntryType': 'Oem' if log == 'Lclog' else 'SEL',
+            'MessageId': 'SYS%04d' % (i % 10000),
+            'Message': 'Simulated %s entry number %d for capacity and paging tests.' % (log, i),
+            'Severity': 'OK' if i % 7 else 'Warning'}
+
+
+class Fixtures(object):
+    # Resource tree of one simulated PowerEdge, sized by the options
+
+    def __init__(self, firmware=35, cpus=2, nics=4, fans=6, lclog=1000, sel=200, expand=True,
+                 jobs=0, job_duration=10.0, sleds=0, drives=8, power_delay=0.0,
+                 sse_interval=1.0, sse_close_after=0, sse_status=200):
+        self.resources = {}
+        self.logs = {'Lclog': lclog, 'Sel': sel}
+        self.expand = expand
+        self.job_duration = job_duration
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        # Power state per (server address, system) after a reset, so that
+        # every 127.x.y.z address of a fleet run is a host of its own
+        self.power_delay = power_delay
+        self.power = {}
+        self.power_lock = threading.Lock()
+        # Event stream: events per connection before the iDRAC closes it
+        # (0 keeps it open) and the status it answers with
+        self.sse_interval = sse_interval
+        self.sse_close_after = sse_close_after
+        self.sse_status = sse_status
+        r = self.resources
+
+        r[ROOT] = {'@odata.id': ROOT, 'RedfishVersion': '1.6.0',
+                   'Systems': {'@odata.id': ROOT + '/Systems'},
+                   'Chassis': {'@odata.id': ROOT + '/Chassis'},
+                   'Managers': {'@odata.id': ROOT + '/Managers'},
+                   'Links': {'Sessions': {'@odata.id': ROOT + '/Sessions'}}}
+        if expand:
+            r[ROOT]['ProtocolFeaturesSupported'] = {
+                'ExpandQuery': {'ExpandAll': True, 'Levels': True, 'MaxLevels': 1, 'Links': True, 'NoLinks': True},
+                'SelectQuery': True}
+        r[ROOT + '/Systems'] = collection(ROOT + '/Systems', [SYSTEM])
+        r[ROOT + '/Chassis'] = collection(ROOT + '/Chassis', [CHASSIS])
+        r[ROOT + '/Managers'] = collection(ROOT + '/Managers', [MANAGER])
+
+        r[SYSTEM] = {'@odata.id': SYSTEM, 'Id': 'System.Embedded.1', 'Name': 'System',
+                     'Status': {'Health': 'OK', 'HealthRollup': 'OK', 'State': 'Enabled'},
+                     'SerialNumber': 'CN7475164I0123', 'SKU': '7X3QRS2', 'PartNumber': '0PPX8GA01',
+                     'Manufacturer': 'Dell Inc.', 'Model': 'PowerEdge R740', 'AssetTag': '',
+                     'UUID': '4c4c4544-0058-3310-8051-b7c04f525332', 'HostName': 'node01',
+                     'BiosVersion': '2.8.2', 'SystemType': 'Physical', 'PowerState': 'On',
+                     'LastResetTime': '2020-01-01T00:00:00-00:00', 'IndicatorLED': 'Off',
+                     'Oem': {'Dell': {'DellSystem': {'SystemID': 0x0715}}},
+                     'MemorySummary': {'Status': {'Health': 'OK'}, 'TotalSystemMemoryGiB': 384},
+                     'ProcessorSummary': {'Count': cpus, 'Model': 'Intel(R) Xeon(R) Gold 6148 CPU @ 2.40GHz',
+                                          'Status': {'Health': 'OK'}},
+                     'Boot': {'BootSourceOverrideTarget': 'None', 'BootSourceOverrideEnabled': 'Disabled'},
+                     'Actions': {'#ComputerSystem.Reset': {
+                         'target': SYSTEM + '/Actions/ComputerSystem.Reset',
+                         'ResetType@Redfish.AllowableValues': ['On', 'ForceOff', 'GracefulRestart',
+                                                               'GracefulShutdown', 'PushPowerButton', 'Nmi']}}}
+        r[SYSTEM + '/BootSources'] = {'Attributes': {'UefiBootSeq': [{'Name': 'NIC.PxeDevice.1-1'},
+                                                                     {'Name': 'RAID.Integrated.1-1'}]}}
+        cpu_ids = ['CPU.Socket.%d' % (i + 1) for i in range(cpus)]
+        r[SYSTEM + '/Processors'] = collection(SYSTEM + '/Processors', [SYSTEM + '/Processors/' + i for i in cpu_ids])
+        for i in cpu_ids:
+            r[SYSTEM + '/Processors/' + i] = {'@odata.id': SYSTEM + '/Processors/' + i, 'Id': i,
+                                               'Model': 'Intel(R) Xeon(R) Gold 6148', 'TotalCores': 20,
+                                               'Status': {'Health': 'OK'}}
+        nic_ids = ['NIC.Integrated.1-%d-1' % (i + 1) for i in range(nics)]
+        r[SYSTEM + '/EthernetInterfaces'] = collection(SYSTEM + '/EthernetInterfaces',
+                                                       [SYSTEM + '/EthernetInterfaces/' + i for i in nic_ids])
+        for n, i in enumerate(nic_ids):
+            r[SYSTEM + '/EthernetInterfaces/' + i] = {'@odata.id': SYSTEM + '/EthernetInterfaces/' + i, 'Id': i,
+                                                       'PermanentMACAddress': '24:6E:96:00:00:%02X' % n,
+                                                       'Status': {'Health': 'OK'}}
+        r[SYSTEM + '/SecureBoot'] = {'SecureBootCurrentBoot': 'Disabled'}
+        # BIOS changes go to the settings object and apply at the next reset
+        r[SYSTEM + '/Bios'] = {'@odata.id': SYSTEM + '/Bios', 'Id': 'BIOS',
+                               'Attributes': {'BootMode': 'Uefi', 'LogicalProc': 'Enabled',
+                                              'ProcVirtualization': 'Enabled', 'SriovGlobalEnable': 'Disabled',
+                                              'SysProfile': 'PerfPerWattOptimizedDapc', 'NumLock': 'On'},
+                               '@Redfish.Settings': {'SettingsObject': {'@odata.id': SYSTEM + '/Bios/Settings'}}}
+        r[SYSTEM + '/Bios/Settings'] = {'@odata.id': SYSTEM + '/Bios/Settings', 'Attributes': {}}
+        r[SYSTEM + '/SecureBoot/Certificates'] = collection(SYSTEM + '/SecureBoot/Certificates',
+                                                            [SYSTEM + '/SecureBoot/Certificates/PK'])
+        r[SYSTEM + '/Storage/Controllers'] = collection(SYSTEM + '/Storage/Controllers',
+                                                        [SYSTEM + '/Storage/Controllers/RAID.Integrated.1-1'])
+        r[SYSTEM + '/Storage/Controllers/RAID.Integrated.1-1'] = {
+            'Id': 'RAID.Integrated.1-1',
+            'Devices': [{'Name': 'Physical Disk 0:1:%d' % i, 'Status': {'Health': 'OK'}} for i in range(4)]}
+
+        self.make_storage(drives)
+
+        fan_ids = ['Fan.Embedded.%d' % (i + 1) for i in range(fans)]
+        r[CHASSIS] = {'@odata.id': CHASSIS, 'Id': 'System.Embedded.1', 'ChassisType': 'RackMount',
+                      'Status': {'Health': 'OK'}, 'IndicatorLED': 'Off', 'PartNumber': '0PPX8GA01',
+                      'Model': 'PowerEdge R740', 'Manufacturer': 'Dell Inc.', 'PowerState': 'On',
+                      'SerialNumber': 'CN7475164I0123', 'SKU': '7X3QRS2', 'AssetTag': '',
+                      'Actions': {'#Chassis.Reset': {'ResetType@Redfish.AllowableValues': ['On', 'ForceOff']}},
+                      'Links': {'CooledBy': [{'@odata.id': CHASSIS + '/Sensors/Fans/0x17||' + f} for f in fan_ids],
+                                'PoweredBy': [{'@odata.id': CHASSIS + '/Power/PowerSupplies/PSU.Slot.%d' % i}
+                                              for i in (1, 2)]}}
+        temps = ['SystemBoardInletTemp', 'SystemBoardExhaustTemp'] + ['CPU%dTemp' % (i + 1) for i in range(cpus)]
+        for t in temps:
+            r[CHASSIS + '/Sensors/Temperatures/iDRAC.Embedded.1%23' + t] = {'Name': t, 'ReadingCelsius': 30 + len(t) % 20}
+        for n, f in enumerate(fan_ids):
+            r[CHASSIS + '/Sensors/Fans/0x17||' + f] = {'Name': f, 'Reading': 5000 + 120 * n}
+        r[CHASSIS + '/Power/PowerControl'] = {'PowerConsumedWatts': 276}
+        r[CHASSIS + '/Thermal'] = {
+            'Temperatures': [{'Name': t, 'ReadingCelsius': 30 + len(t) % 20, 'UpperThresholdCritical': 90,
+                              'Status': {'Health': 'OK'}} for t in temps],
+            'Fans': [{'Name': f, 'Reading': 5000 + 120 * n, 'ReadingUnits': 'RPM', 'Status': {'Health': 'OK'}}
+                     for n, f in enumerate(fan_ids)]}
+        r[CHASSIS + '/Power'] = {
+            'PowerControl': [{'Name': 'System Power Control', 'PowerConsumedWatts': 276, 'PowerCapacityWatts': 1600,
+                              'PowerMetrics': {'AverageConsumedWatts': 270, 'MaxConsumedWatts': 410,
+                                               'MinConsumedWatts': 190}}],
+            'PowerSupplies': [{'Name': 'PS%d Status' % i, 'PowerInputWatts': 150, 'PowerOutputWatts': 138,
+                               'LineInputVoltage': 230, 'Status': {'Health': 'OK'}} for i in (1, 2)],
+            'Voltages': [{'Name': 'PS%d Voltage 1' % i, 'ReadingVolts': 230, 'Status': {'Health': 'OK'}}
+                         for i in (1, 2)]}
+
+        r[MANAGER] = {'@odata.id': MANAGER, 'Id': 'iDRAC.Embedded.1', 'Model': '14G Monolithic',
+                      'UUID': '3132334f-c0b7-3480-3510-00364c4c4544', 'DateTime': '2017-06-01T12:00:00-05:00',
+                      'Status': {'Health': 'OK'}, 'FirmwareVersion': '3.21.21.21',
+                      'CommandShell': {'ConnectTypesSupported': ['SSH', 'Telnet', 'IPMI']},
+                      'GraphicalConsole': {'ConnectTypesSupported': ['KVMIP']},
+                      'Actions': {'#Manager.Reset': {'ResetType@Redfish.AllowableValues': ['GracefulRestart']}}}
+        r[MANAGER + '/EthernetInterfaces'] = collection(MANAGER + '/EthernetInterfaces',
+                                                        [MANAGER + '/EthernetInterfaces/iDRAC.Embedded.1%23NIC.1'])
+        r[MANAGER + '/NetworkProtocol'] = {'HostName': 'idrac-node01'}
+        r[MANAGER + '/Attributes'] = {'@odata.id': MANAGER + '/Attributes', 'Id': 'iDRACAttributes',
+                                      'Attributes': {'IPMILan.1.Enable': 'Enabled', 'NTPConfigGroup.1.NTP1': '',
+                                                     'NTPConfigGroup.1.NTPEnable': 'Disabled',
+                                                     'Time.1.Timezone': 'UTC', 'WebServer.1.Timeout': 1800}}
+        r[MANAGER + '/Jobs'] = collection(MANAGER + '/Jobs', [])
+
+        r[ROOT + '/EventService'] = {'Status': {'Health': 'OK', 'State': 'Enabled'},
+                                     'ServerSentEventUri': ROOT + '/SSE',
+                                     'EventTypesForSubscription': ['StatusChange', 'ResourceUpdated',
+                                                                   'ResourceAdded', 'ResourceRemoved', 'Alert']}
+
+        fw_ids = []
+        for i in range(firmware):
+            fw_id = 'Installed-%d-%d.%d.%d' % (25000 + i, 1 + i % 4, i % 10, i % 3)
+            fw_ids.append(fw_id)
+            r[FIRMWARE + '/' + fw_id] = {'@odata.id': FIRMWARE + '/' + fw_id, 'Id': fw_id,
+                                         'Name': 'Component %d' % i, 'SoftwareId': str(25000 + i),
+                                         'Version': '%d.%d.%d' % (1 + i % 4, i % 10, i % 3),
+                                         'Updateable': True, 'Status': {'Health': 'OK', 'State': 'Enabled'}}
+        r[FIRMWARE] = collection(FIRMWARE, [FIRMWARE + '/' + i for i in fw_ids])
+        for i in range(jobs):
+            self.add_job('Simulated job %d' % i)
+        if sleds:
+            self.make_sleds(sleds)
+
+    def make_sleds(self, sleds):
+        # Like an MX7000 chassis manager: the Systems collection lists one
+        # member per sled and there is no System.Embedded.1
+        r = self.resources
+        systems = []
+        for n in range(sleds):
+            uri = ROOT + '/Systems/Sled.Slot.%d' % (n + 1)
+            systems.append(uri)
+            for path in [p for p in list(r) if p == SYSTEM or p.startswith(SYSTEM + '/')]:
+                doc = json.loads(json.dumps(r[path]).replace(SYSTEM, uri))
+                if path == SYSTEM:
+                    doc['Id'] = uri.rsplit('/', 1)[-1]
+                    doc['SerialNumber'] = 'SLED%04d' % (n + 1)
+                r[uri + path[len(SYSTEM):]] = doc
+        for path in [p for p in list(r) if p == SYSTEM or p.startswith(SYSTEM + '/')]:
+            del r[path]
+        r[ROOT + '/Systems'] = collection(ROOT + '/Systems', systems)
+
+    def make_storage(self, drives):
+        # A PERC with `drives` SAS drives in one RAID volume per pair, a
+        # BOSS card with two M.2 drives in RAID1 and two direct NVMe drives
+        r = self.resources
+        base = SYSTEM + '/Storage'
+        layout = [('RAID.Integrated.1-1', 'PERC H740P Mini', 'SAS', 'HDD', drives),
+                  ('AHCI.Slot.2-1', 'BOSS-S1', 'SATA', 'SSD', 2),
+                  ('CPU.1', 'CPU.1', 'NVMe', 'SSD', 2)]
+        for (ctrl, model, protocol, media, count) in layout:
+            uri = base + '/' + ctrl
+            drive_uris = ['%s/Drives/Disk.Bay.%d:Enclosure.Internal.0-1:%s' % (uri, i, ctrl) for i in range(count)]
+            for n, d in enumerate(drive_uris):
+                r[d] = {'@odata.id': d, 'Id': d.rsplit('/', 1)[-1], 'Name': 'Physical Disk 0:1:%d' % n,
+                        'Model': 'ST1200MM0099' if media == 'HDD' else 'MZ7KH480HAHQ0D3',
+                        'SerialNumber': 'S%s%04d' % (ctrl[:4].upper(), n), 'CapacityBytes': 1200243695616,
+                        'MediaType': media, 'Protocol': protocol, 'FailurePredicted': n == 5,
+                        'PredictedMediaLifeLeftPercent': None if media == 'HDD' else 97,
+                        'Status': {'Health': 'Warning' if n == 5 else 'OK', 'State': 'Enabled'}}
+            volume_uris = []
+            if protocol != 'NVMe':
+                for v in range(max(1, count // 2)):
+                    vid = 'Disk.Virtual.%d:%s' % (v, ctrl)
+                    vuri = uri + '/Volumes/' + vid
+                    volume_uris.append(vuri)
+                    r[vuri] = {'@odata.id': vuri, 'Id': vid, 'Name': 'VD%d' % v, 'RAIDType': 'RAID1',
+                               'CapacityBytes': 1200243695616, 'Status': {'Health': 'OK'},
+                               'Links': {'Drives': [{'@odata.id': d} for d in drive_uris[2 * v:2 * v + 2]]}}
+            r[uri + '/Volumes'] = collection(uri + '/Volumes', volume_uris)
+            r[uri] = {'@odata.id': uri, 'Id': ctrl, 'Name': model, 'Status': {'Health': 'OK'},
+                      'StorageControllers': [{'Model': model, 'FirmwareVersion': '51.13.0-3485'}],
+                      'Drives': [{'@odata.id': d} for d in drive_uris],
+                      'Volumes': {'@odata.id': uri + '/Volumes'}}
+        r[base] = collection(base, [base + '/' + c[0] for c in layout])
+
+    def expanded(self, doc):
+        # $expand=*($levels=1): every link in the resource, top-level links
+        # and arrays of links (Members, Drives), replaced by its target
+        doc = dict(doc)
+        for key, value in doc.items():
+            if isinstance(value, list) and value and all(is_link(v) for v in value):
+                doc[key] = [self.resource(v['@odata.id']) or v for v in value]
+            elif is_link(value):
+                doc[key] = self.resource(value['@odata.id']) or value
+        return doc
+
+    def add_job(self, name, duration=None):
+        # A job runs from 0 to 100 percent over its duration after creation
+        with self.jobs_lock:
+            job_id = 'JID_%012d' % (len(self.jobs) + 1)
+            self.jobs[job_id] = {'name': name, 'created': time.time(),
+                                 'duration': self.job_duration if duration is None else duration}
+        return job_id
+
+    def job(self, job_id):
+        job = self.jobs[job_id]
+        done = min(1.0, (time.time() - job['created']) / job['duration']) if job['duration'] else 1.0
+        return {'@odata.id': MANAGER + '/Jobs/' + job_id, 'Id': job_id, 'Name': job['name'],
+                'JobState': 'Completed' if done >= 1.0 else 'Running',
+                'PercentComplete': int(done * 100),
+                'Message': 'Job completed successfully.' if done >= 1.0 else 'Job in progress.'}
+
+    def job_resource(self, path):
+        # Jobs change over time, so they're built per request
+        if path == MANAGER + '/Jobs':
+            return collection(path, [MANAGER + '/Jobs/' + j for j in sorted(self.jobs)])
+        job_id = path.rsplit('/', 1)[-1]
+        if path.startswith(MANAGER + '/Jobs/') and job_id in self.jobs:
+            return self.job(job_id)
+        return None
+
+    def resource(self, path):
+        return self.job_resource(path) or self.resources.get(path)
+
+    # ResetType -> (PowerState during the transition, PowerState after it)
+    POWER_TRANSITIONS = {'On': ('PoweringOn', 'On'),
+                         'ForceOff': ('PoweringOff', 'Off'),
+                         'GracefulShutdown': ('PoweringOff', 'Off'),
+                         'GracefulRestart': ('Off', 'On'),
+                         'ForceRestart': ('Off', 'On'),
+                         'PowerCycle': ('Off', 'On')}
+
+    def power_state(self, host, system):
+        with self.power_lock:
+            entry = self.power.get((host, system))
+        if entry is None:
+            return (self.resources.get(system) or {}).get('PowerState')
+        (during, after, until, reset_time) = entry
+        return after if time.time() >= until else during
+
+    def last_reset_time(self, host, system):
+        with self.power_lock:
+            entry = self.power.get((host, system))
+        if entry is None:
+            return (self.resources.get(system) or {}).get('LastResetTime')
+        return time.strftime('%Y-%m-%dT%H:%M:%S-00:00', time.gmtime(entry[3]))
+
+    def reset(self, host, system, reset_type):
+        # The new state shows after power_delay seconds, a restart passing
+        # through Off on the way
+        if reset_type == 'PushPowerButton':
+            reset_type = 'GracefulShutdown' if self.power_state(host, system) == 'On' else 'On'
+        if reset_type in self.POWER_TRANSITIONS:
+            (during, after) = self.POWER_TRANSITIONS[reset_type]
+            with self.power_lock:
+                self.power[(host, system)] = (during, after, time.time() + self.power_delay, time.time())
+
+    def apply_settings(self, system):
+        # A reset applies the system's pending BIOS settings
+        settings = self.resources.get(system + '/Bios/Settings')
+        if settings and settings['Attributes']:
+            self.resources[system + '/Bios']['Attributes'].update(settings['Attributes'])
+            settings['Attributes'] = {}
+
+    def event(self, i):
+        return {'@odata.type': '#Event.v1_3_0.Event', 'Id': str(i), 'Name': 'Event Array',
+                'Events': [{'EventId': str(i), 'EventType': 'Alert', 'MessageId': 'SYS%04d' % (i % 10000),
+                            'Message': 'Simulated event number %d.' % i,
+                            'Severity': 'OK' if i % 7 else 'Warning',
+                            'OriginOfCondition': {'@odata.id': SYSTEM}}]}
+
+    def log_page(self, log, skip, top):
+        # Newest entry first, like the iDRAC Lifecycle log
+        total = self.logs[log]
+        ids = range(total - skip, max(total - skip - top, 0), -1)
+        uri = '%s/Logs/%s' % (MANAGER, log)
+        page = {'@odata.id': uri, 'Members': [log_entry(log, i) for i in ids], 'Members@odata.count': total}
+        if skip + top < total:
+            page['Members@odata.nextLink'] = '%s?$skip=%d&$top=%d' % (uri, skip + top, top)
+        return page
+
+
+class MockRedfishServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # A fleet run opens hundreds of connections at once; the default
+    # backlog of 5 drops SYNs and adds a second per retransmit
+    request_queue_size = 1024
+
+    def __init__(self, address, fixtures, latency=0.0, jitter=0.0, max_concurrent=0,
+                 throttle_rate=0.0, page_size=50, certfile=None, keyfile=None):
+        HTTPServer.__init__(self, address, MockRedfishHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.reset_stats()
+        self.scheme = 'http'
+        self.context = None
+        if certfile:
+            import ssl
+            self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.context.load_cert_chain(certfile, keyfile)
+            self.scheme = 'https'
+
+    def finish_request(self, request, client_address):
+        # The TLS handshake runs here, in the connection's own thread,
+        # rather than on a wrapped listening socket where accept() would
+        # do every handshake one after another
+        if self.context is None:
+            return HTTPServer.finish_request(self, request, client_address)
+        try:
+            request = self.context.wrap_socket(request, server_side=True)
+        except (IOError, OSError):
+            return
+        try:
+            HTTPServer.finish_request(self, request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    @property
+    def address(self):
+        return '%s:%d' % self.server_address[:2]
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'by_method': {}, 'by_path': {}, 'status': {},
+                          'bytes': 0, 'rejected': 0, 'throttled': 0, 'connections': 0}
+
+    def count(self, method, path, status, size):
+        with self.lock:
+            s = self.stats
+            s['requests'] += 1
+            s['bytes'] += size
+            s['by_method'][method] = s['by_method'].get(method, 0) + 1
+            s['by_path'][path] = s['by_path'].get(path, 0) + 1
+            s['status'][str(status)] = s['status'].get(str(status), 0) + 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MockRedfishHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this Nagle's
+    # algorithm adds delayed-ACK stalls that dwarf the configured latency
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.stats['connections'] += 1
+
+    def reply(self, status, doc=None, headers=None):
+        body = b'' if doc is None else json.dumps(doc).encode('utf-8')
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+        self.server.count(self.command, urlparse(self.path).path, status, len(body))
+
+    def error(self, status, message):
+        self.reply(status, {'error': {'code': 'Base.1.0.GeneralError', 'message': message,
+                                      '@Message.ExtendedInfo': [{'Message': message}]}})
+
+    def handle_one(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if urlparse(self.path).path == '/mock/stats':
+            if method == 'DELETE':
+                server.reset_stats()
+                return self.reply(204)
+            with server.lock:
+                stats = json.loads(json.dumps(server.stats))
+            return self.reply(200, stats)
+        if server.slots is not None and not server.slots.acquire(False):
+            with server.lock:
+                server.stats['rejected'] += 1
+            return self.error(503, 'Too many concurrent requests')
+        try:
+            if server.throttle_rate and random.random() < server.throttle_rate:
+                with server.lock:
+                    server.stats['throttled'] += 1
+                return self.reply(429, {'error': {'@Message.ExtendedInfo': [{'Message': 'Throttled'}]}},
+                                  {'Retry-After': '1'})
+            if server.latency or server.jitter:
+                time.sleep(server.latency + random.random() * server.jitter)
+            if not self.authorized():
+                return self.error(401, 'Unauthorized')
+            return getattr(self, 'route_' + method)(body)
+        finally:
+            if server.slots is not None:
+                server.slots.release()
+
+    def authorized(self):
+        if self.headers.get('Authorization', '').startswith('Basic '):
+            return True
+        if self.command == 'POST' and urlparse(self.path).path == ROOT + '/Sessions':
+            return True
+        return self.headers.get('X-Auth-Token') in self.server.sessions
+
+    def stream_events(self):
+        # text/event-stream without Content-Length: the body ends when the
+        # connection closes, after sse_close_after events or never
+        fixtures = self.server.fixtures
+        if fixtures.sse_status != 200:
+            return self.error(fixtures.sse_status, 'Event stream unavailable')
+        try:
+            last = int(self.headers.get('Last-Event-ID') or 0)
+        except ValueError:
+            last = 0
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.server.count('GET', ROOT + '/SSE', 200, 0)
+        sent = 0
+        try:
+            while not fixtures.sse_close_after or sent < fixtures.sse_close_after:
+                time.sleep(fixtures.sse_interval)
+                last += 1
+                sent += 1
+                self.wfile.write(('id: %d\ndata: %s\n\n' % (last, json.dumps(fixtures.event(last))))
+                                 .encode('utf-8'))
+                self.wfile.flush()
+        except (IOError, OSError):
+            pass
+
+    def route_GET(self, body):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        fixtures = self.server.fixtures
+        path = url.path.rstrip('/') or '/'
+        log = path.rsplit('/', 1)[-1]
+        if path == ROOT + '/SSE':
+            return self.stream_events()
+        if path.startswith(MANAGER + '/Logs/') and log in fixtures.logs:
+            doc = fixtures.log_page(log, int(query.get('$skip', 0)), int(query.get('$top', self.server.page_size)))
+        else:
+            doc = fixtures.resource(path)
+            if doc is None:
+                return self.error(404, 'Resource %s not found' % path)
+            if 'PowerState' in doc and fixtures.power:
+                host = self.connection.getsockname()[0]
+                doc = dict(doc, PowerState=fixtures.power_state(host, path))
+                if 'LastResetTime' in doc:
+                    doc['LastResetTime'] = fixtures.last_reset_time(host, path)
+        if '$expand' in query and fixtures.expand:
+            doc = fixtures.expanded(doc)
+        if '$select' in query and fixtures.expand:
+            keys = query['$select'].split(',')
+            doc = dict((k, v) for k, v in doc.items() if k in keys or k.startswith('@odata'))
+        etag = '"%s"' % hashlib.md5(json.dumps(doc, sort_keys=True).encode('utf-8')).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, None, {'ETag': etag})
+        return self.reply(200, doc, {'ETag': etag})
+
+    def route_POST(self, body):
+        path = urlparse(self.path).path
+        if path == ROOT + '/Sessions':
+            token = hashlib.sha1(str(random.random()).encode('utf-8')).hexdigest()
+            uri = ROOT + '/Sessions/%s' % token[:8]
+            self.server.sessions[token] = uri
+            return self.reply(201, {'@odata.id': uri}, {'X-Auth-Token': token, 'Location': uri})
+        if path.endswith('/Actions/ComputerSystem.Reset'):
+            reset = json.loads(body.decode('utf-8') or '{}').get('ResetType')
+            system = path.rsplit('/Actions/', 1)[0]
+            if system not in self.server.fixtures.resources:
+                return self.error(404, 'Resource %s not found' % system)
+            self.server.fixtures.reset(self.connection.getsockname()[0], system, reset)
+            self.server.fixtures.apply_settings(system)
+            return self.reply(204)
+        if path.endswith('/Actions/Manager.Reset'):
+            return self.reply(204)
+        if path == MANAGER + '/Jobs':
+            # Dell config job, e.g. to apply pending BIOS settings
+            job_id = self.server.fixtures.add_job('Configure: ' + json.loads(body.decode('utf-8') or '{}')
+                                                  .get('TargetSettingsURI', ''))
+            return self.reply(200, {}, {'Location': MANAGER + '/Jobs/' + job_id})
+        if path == ROOT + '/EventService/Subscriptions':
+            return self.reply(201, None, {'Location': path + '/1'})
+        return self.error(404, 'No action at %s' % path)
+
+    def route_PATCH(self, body):
+        path = urlparse(self.path).path
+        doc = self.server.fixtures.resources.get(path)
+        if doc is None:
+            return self.error(404, 'Resource %s not found' % path)
+        update = json.loads(body.decode('utf-8') or '{}')
+        for key, value in update.items():
+            if isinstance(value, dict) and isinstance(doc.get(key), dict):
+                doc[key].update(value)
+            else:
+                doc[key] = value
+        return self.reply(200, {})
+
+    def route_DELETE(self, body):
+        path = urlparse(self.path).path
+        for token, uri in list(self.server.sessions.items()):
+            if uri == path:
+                del self.server.sessions[token]
+                return self.reply(200, {})
+        return self.reply(200, {})
+
+    def do_GET(self):
+        self.handle_one('GET')
+
+    def do_POST(self):
+        self.handle_one('POST')
+
+    def do_PATCH(self):
+        self.handle_one('PATCH')
+
+    def do_DELETE(self):
+        self.handle_one('DELETE')
+
+
+def add_fixture_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra seconds, up to this much")
+    parser.add_argument('--max-concurrent', type=int, default=0, help="503 beyond this many requests in flight")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--page-size', type=int, default=50, help="log entries per page")
+    parser.add_argument('--firmware', type=int, default=35, help="firmware inventory components")
+    parser.add_argument('--cpus', type=int, default=2)
+    parser.add_argument('--nics', type=int, default=4)
+    parser.add_argument('--fans', type=int, default=6)
+    parser.add_argument('--lclog', type=int, default=1000, help="Lifecycle log entries")
+    parser.add_argument('--sel', type=int, default=200, help="SEL entries")
+    parser.add_argument('--no-expand', action='store_true', help="behave like firmware without $expand/$select")
+    parser.add_argument('--jobs', type=int, default=0, help="jobs queued at start up")
+    parser.add_argument('--job-duration', type=float, default=10.0, help="seconds a job takes to complete")
+    parser.add_argument('--drives', type=int, default=8, help="drives behind the PERC")
+    parser.add_argument('--sleds', type=int, default=0, help="serve this many sled Systems instead of System.Embedded.1")
+    parser.add_argument('--power-delay', type=float, default=0.0, help="seconds a reset takes to change PowerState")
+    parser.add_argument('--sse-interval', type=float, default=1.0, help="seconds between streamed events")
+    parser.add_argument('--sse-close-after', type=int, default=0,
+                        help="close the event stream after this many events, 0 keeps it open")
+    parser.add_argument('--sse-status', type=int, default=200, help="answer the event stream with this status")
+
+
+def server_from_args(args, address):
+    fixtures = Fixtures(firmware=args.firmware, cpus=args.cpus, nics=args.nics, fans=args.fans,
+                        lclog=args.lclog, sel=args.sel, expand=not args.no_expand,
+                        jobs=args.jobs, job_duration=args.job_duration, sleds=args.sleds,
+                        drives=args.drives, power_delay=args.power_delay,
+                        sse_interval=args.sse_interval, sse_close_after=args.sse_close_after,
+                        sse_status=args.sse_status)
+    return MockRedfishServer(address, fixtures, latency=args.latency, jitter=args.jitter,
+                             max_concurrent=args.max_concurrent, throttle_rate=args.throttle_rate,
+                             page_size=args.page_size, certfile=args.certfile, keyfile=args.keyfile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated iDRAC Redfish service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help="serve HTTPS with this certificate, as the module expects")
+    parser.add_argument('--keyfile')
+    add_fixture_arguments(parser)
+    args = parser.parse_args()
+    server = server_from_args(args, (args.host, args.port))
+    sys.stderr.write("Serving simulated iDRAC on %s://%s\n" % (server.scheme, server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -38,7 +38,31 @@ options:
         required: true
         default: None
         description:
-            - sub module command is going to execute 
+            - sub module command is going to execute. A list (or a comma
+              separated string) runs several commands of the same subsystem
+              in one invocation; each Redfish resource is fetched only once
+              and stdout becomes a dict keyed by command. Commands per
+              subsystem, as listed in the module's COMMANDS registry:
+            - System: AssetTag, BiosVersion, BootSources, CPUs, Configure,
+              EthernetInterfaces, Health, HostName, IndicatorLED,
+              Manufacturer, MemoryHealth, Model, OneTimeBoot,
+              PermanentMACAddress, PowerState, ProcessorCount,
+              ProcessorHealth, ProcessorModel, Reset, SecureBoot,
+              SecureBootCerts, SerialNumber, ServiceTag,
+              StorageControllerDisks, StorageControllers,
+              StorageTopology, SystemType, TotalSystemMemoryGiB, UUID,
+              WaitJobs
+            - Manager: CommandShells, Configure, DateTime, EthernetInterfaces,
+              FirmwareVersion, GraphicalConsole, Health, Jobs, LCLogs,
+              Model, Reset, ResetOptions, SELLogs, UUID, WaitJobs
+            - Chassis: AssetTag, BoardExhaustTemp, BoardInletTemp, CPUTemp,
+              ChassisType, Configure, CooledBy, FANRPM, Health, IndicatorLED,
+              Manufacturer, Model, PartNumber, PowerConsumedWatts,
+              PowerState, PoweredBy, ResetTypes, SKU, SerialNumber,
+              Telemetry
+            - Event: health, state, types
+            - Session: id
+            - FW: Compliance, FirmwareInventory
     idracip:
         required: true
         default: None
@@ -78,7 +102,8 @@ options:
         default: None
         choices=["None","Pxe","Floppy","Cd","Hdd","BiosSetup","Utilities","UefiTarget","SDCard","UefiHttp"])
         description:
-          - system set to onetime boot from sources
+          - system set to onetime boot from sources. Nothing is written,
+            and changed is false, when the override is already set.
     FAN:
         required: False
         default: None
@@ -88,104 +113,1440 @@ options:
         required: False
         default: None
         description:
-            - This is CPU socket name in chassis i.e CPU1, CPU2 etc 
-    
+            - This is CPU socket name in chassis i.e CPU1, CPU2 etc
+    auth_mode:
+        required: False
+        default: basic
+        choices: [ basic, session ]
+        description:
+            - C(basic) sends HTTP basic auth with every request. C(session)
+              logs in once through the Redfish Sessions service, reuses the
+              X-Auth-Token and deletes the session on exit.
+    pool_maxsize:
+        required: False
+        default: 4
+        description:
+            - Number of keep-alive connections kept open to the iDRAC
+    max_concurrency:
+        required: False
+        default: 4
+        description:
+            - Maximum number of requests sent to the iDRAC at the same time
+              when fetching the members of a collection such as the
+              firmware inventory. Keep it below the iDRAC session limit.
+              The limit is per iDRAC for the whole process, so it also holds
+              when fleet tools drive several clients against one host.
+    odata_query:
+        required: False
+        default: True
+        description:
+            - Use the Redfish $expand and $select query parameters when the
+              service root advertises them in ProtocolFeaturesSupported.
+              Set to False for firmware with a broken implementation.
+    cache_dir:
+        required: False
+        default: None
+        description:
+            - Directory where GET responses are cached between tasks, one
+              sub directory per iDRAC. Caching is disabled when unset. The
+              module runs where the task runs, so use a local connection or
+              C(delegate_to: localhost) to keep the cache on the controller.
+              Any reset or boot override call clears the host's cache.
+    cache_ttl:
+        required: False
+        default: 300
+        description:
+            - Seconds a cached response is used without asking the iDRAC.
+              After that it is revalidated with If-None-Match, so an
+              unchanged resource costs a 304 without a body.
+    cache_resource_ttl:
+        required: False
+        default: None
+        description:
+            - Per resource override of cache_ttl, keyed by the path below
+              /redfish/v1, e.g. C({"Systems/System.Embedded.1": 86400}).
+              The longest matching path wins.
+    log_dest:
+        required: False
+        default: None
+        description:
+            - For SELLogs and LCLogs, append the entries to this file as
+              NDJSON instead of returning them; stdout then holds a summary.
+              All pages of the log are followed either way, up to log_top
+              entries. Pages are parsed entry by entry as they arrive, so
+              with log_dest memory use doesn't grow with the page or log
+              size. Nothing is appended in check mode.
+    log_cursor:
+        required: False
+        default: None
+        description:
+            - File remembering the newest SELLogs/LCLogs entry seen, so the
+              next run only returns newer entries. Use one file per iDRAC.
+              In check mode the cursor is read but not advanced.
+    log_skip:
+        required: False
+        default: None
+        description:
+            - Number of log entries to skip ($skip)
+    log_top:
+        required: False
+        default: None
+        description:
+            - Return at most this many log entries. They are asked for with
+              $top, so a few entries cost a single request, and no further
+              page is read once that many have arrived.
+    timings:
+        required: False
+        default: False
+        description:
+            - Time every HTTP request and return the records under
+              C(timings) in the result. Each record has the method, URI,
+              status, body bytes and the TCP connect, TLS handshake, time to
+              first byte (from the start of the request, so it includes
+              the connect), download and JSON decode times in milliseconds.
+              Connect and TLS are 0 when a kept-alive connection was reused;
+              a new HTTPS connection also has C(tls_resumed), true when it
+              resumed an earlier TLS session.
+    trace_file:
+        required: False
+        default: None
+        description:
+            - Append the request timings to this file as OpenTelemetry
+              (OTLP/JSON) spans, one line per invocation below a span for
+              the whole task, e.g. for the collector's otlpjsonfile
+              receiver. Implies I(timings) for the trace, not the result.
+    connect_timeout:
+        required: False
+        default: 10
+        description:
+            - Seconds to wait for the TCP connection to the iDRAC.
+    read_timeout:
+        required: False
+        default: 60
+        description:
+            - Seconds to wait for the iDRAC between bytes of a response. A
+              hung iDRAC fails the task after this instead of stalling the
+              fork. Event streams are exempt.
+    retries:
+        required: False
+        default: 3
+        description:
+            - Extra attempts for a request that hit a timeout, a dropped
+              connection, 429 or a 5xx. POST and PATCH are only repeated on
+              429, 503 or when no connection could be made, since anything
+              else may already have taken effect.
+    retry_backoff:
+        required: False
+        default: 0.5
+        description:
+            - Base of the exponential backoff between attempts in seconds.
+              Attempt n waits a random time up to retry_backoff * 2^n, or
+              what the iDRAC asked for in Retry-After.
+    retry_backoff_max:
+        required: False
+        default: 30
+        description:
+            - Upper bound of a single wait between attempts, Retry-After
+              included.
+    baseline:
+        required: False
+        default: None
+        description:
+            - Approved firmware for the FW Compliance command, either a Dell
+              Catalog.xml or a JSON file. The JSON is an object mapping
+              SoftwareId (or inventory Id) to version, or a list of objects
+              with SoftwareId or Id, Version and optionally Name. Only
+              installed components whose version differs from the baseline
+              are returned, keyed by inventory Id. Components the baseline
+              doesn't list are not reported. Catalog entries for other
+              PowerEdge models than the host's (its Dell SystemID) are
+              ignored. The parsed baseline is kept in
+              cache_dir when that is set, so a large catalog is only read
+              once.
+    job_ids:
+        required: False
+        default: None
+        description:
+            - iDRAC job ids (JID_...) for the WaitJobs command. Jobs started
+              by earlier commands of the same cmd list are waited for too.
+              WaitJobs returns state, percent complete, message and seconds
+              waited per job, and fails for jobs that failed or are still
+              running at job_timeout.
+    job_timeout:
+        required: False
+        default: 3600
+        description:
+            - Seconds WaitJobs waits for all jobs to finish.
+    job_poll_interval:
+        required: False
+        default: 2
+        description:
+            - Seconds between job polls right after progress. Every poll
+              reads all jobs with one $expand GET of the Jobs collection.
+              While no job moves the interval doubles up to job_poll_max.
+    job_poll_max:
+        required: False
+        default: 30
+        description:
+            - Longest interval between job polls in seconds.
+    system_id:
+        required: False
+        default: None
+        description:
+            - Member of /redfish/v1/Systems to use, e.g. a sled of a
+              multi-node chassis. When unset System.Embedded.1 is used. If
+              the iDRAC has no such member, reads go to the only member of
+              the collection; with several members, or for a change or an
+              action, the task fails listing them, so set system_id or use
+              all_members.
+    chassis_id:
+        required: False
+        default: None
+        description:
+            - Member of /redfish/v1/Chassis to use, like system_id.
+    manager_id:
+        required: False
+        default: None
+        description:
+            - Member of /redfish/v1/Managers to use, like system_id.
+    all_members:
+        required: False
+        default: False
+        description:
+            - Run the commands of the System, Chassis or Manager subsystem
+              against every member of its collection, such as all sleds
+              behind an MX7000 chassis manager, several members at a time
+              up to max_concurrency. stdout and stderr are then keyed by
+              member id. The member list is discovered once per host and
+              process, and kept in cache_dir when that is set.
+    output:
+        required: False
+        default: text
+        choices: [ text, structured ]
+        description:
+            - C(text) returns every command's result as a string in stdout,
+              lists and dicts as JSON or Python repr strings, as always.
+              C(structured) returns native values instead, without the
+              @odata annotations, under C(data) keyed by command (by member
+              id first with all_members). Every command has a key, null when
+              it failed; the messages are under C(errors).
+    compress_threshold:
+        required: False
+        default: None
+        description:
+            - With structured output, move any C(data) entry whose JSON is
+              longer than this many bytes to C(data_gzip) as gzip compressed,
+              base64 encoded JSON, e.g. logs and inventories of fleet runs.
+              Decode with json.loads(gzip.decompress(base64.b64decode(s))).
+    attributes:
+        required: False
+        default: None
+        description:
+            - Desired state for the Configure command, keyed by target.
+              C(Bios) and C(iDRAC) take attribute names of the system's BIOS
+              and of the iDRAC (Managers/.../Attributes). C(System),
+              C(Chassis) and C(Manager) take properties of those resources,
+              and any other key is a path below /redfish/v1 whose
+              properties are given, e.g. C({"Attributes": {...}}) for NIC
+              attributes. Every target is read first and only the
+              properties that differ are written, one PATCH per resource;
+              changed is false when nothing differs. Resources with a
+              settings object, like the BIOS, get the PATCH there and a
+              config job that applies it at the next reboot; values already
+              pending are not written again. stdout lists the changes per
+              target as before and after values. In check mode nothing is
+              written.
+    snapshot_dir:
+        required: False
+        default: None
+        description:
+            - Report only what changed since the previous run. A hash of every
+              command's result is kept per host in this directory, and only
+              the commands whose result differs from the last run are
+              returned, with C(changed) true when there is any. Failed
+              commands keep their previous hash. Resources are always
+              revalidated with If-None-Match, so an unchanged host costs a
+              304 per resource; responses are cached below this directory
+              when cache_dir is unset. In check mode the snapshot is compared
+              but not updated.
+    transport:
+        required: False
+        default: requests
+        choices: [ requests, http.client ]
+        description:
+            - HTTP client for the Redfish requests. C(http.client) uses only
+              the Python standard library with its own keep-alive connection
+              pool, so neither requests nor urllib3 is imported, which makes
+              short tasks start faster and use less memory. It ignores
+              proxy settings from the environment.
+    pin_dir:
+        required: False
+        default: None
+        description:
+            - Pin the certificate of every iDRAC, trusting it on first use.
+              The SHA-256 fingerprint of the certificate a host presents the
+              first time is written to C(<pin_dir>/<host>_<port>.json) on
+              the controller, and from then on a different certificate fails
+              the connection without retrying. A fingerprint can be put
+              there beforehand, with or without colons, to skip the first
+              use trust; after replacing an iDRAC's certificate remove its
+              file. Without pin_dir certificates are not checked. Either
+              way, connections after the first to the same iDRAC within the
+              process resume its TLS session instead of doing a full
+              handshake; sessions are not kept across module runs.
 '''
 ANSIBLE_METADATA = {'status': ['preview'],
                     'supported_by': 'community',
                     'version': '0.1'}
-import requests
 import os
+import re
+import io
+import copy
+import gzip
 import json
-from ansible.module_utils.basic import AnsibleModule
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
+import base64
+import codecs
+import time
+import shutil
+import random
+import hashlib
+import tempfile
+import binascii
+import socket
+import threading
+from collections import namedtuple
+
+# requests with its urllib3 stack and AnsibleModule take longer to import
+# than most commands take to run, so they are imported where first used:
+# requests only by the requests transport, AnsibleModule only by main().
+
+# Set up times of the connection the current thread last opened, written by
+# the timed connections of either transport and read back by iDRAC._send()
+_conn_timing = threading.local()
+_trace_lock = threading.Lock()
+
+def disable_insecure_warnings():
+    # Disable insecure-certificate-warning message
+    import requests
+    from requests.packages.urllib3.exceptions import InsecureRequestWarning
+    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+_adapters = {}
+
+def http_adapter(timed=False):
+    # HTTPAdapter whose pools wrap their sockets with the ssl_context it is
+    # given, instead of building a default context per pool. The timed one's
+    # urllib3 connections also record their connect and TLS times; it is
+    # only mounted when timings are asked for, so the default path keeps
+    # the stock urllib3 connections. Built on first use.
+    if timed in _adapters:
+        return _adapters[timed]
+    import requests
+    from requests.packages.urllib3 import connection, connectionpool
+
+    class ContextHTTPAdapter(requests.adapters.HTTPAdapter):
+        def __init__(self, ssl_context=None, **kwargs):
+            self.ssl_context = ssl_context
+            super(ContextHTTPAdapter, self).__init__(**kwargs)
+
+        def init_poolmanager(self, *args, **kwargs):
+            if self.ssl_context is not None:
+                kwargs['ssl_context'] = self.ssl_context
+            super(ContextHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+    if not timed:
+        _adapters[timed] = ContextHTTPAdapter
+        return ContextHTTPAdapter
+
+    class _TimedConnection(object):
+        # connect() is the TCP connect plus, for HTTPS, the TLS handshake;
+        # _new_conn() is the TCP connect alone
+        def _new_conn(self):
+            start = time.time()
+            sock = super(_TimedConnection, self)._new_conn()
+            _conn_timing.tcp = time.time() - start
+            return sock
+
+        def connect(self):
+            start = time.time()
+            super(_TimedConnection, self).connect()
+            _conn_timing.connect = time.time() - start
+
+    class _TimedHTTPConnection(_TimedConnection, connection.HTTPConnection):
+        pass
+
+    class _TimedHTTPSConnection(_TimedConnection, connection.HTTPSConnection):
+        pass
+
+    class _TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class TimedHTTPAdapter(ContextHTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                       'https': _TimedHTTPSConnectionPool}
+
+    _adapters[timed] = TimedHTTPAdapter
+    return TimedHTTPAdapter
+
+# Client TLS contexts of this process, one per pin store; see tls_context()
+_tls_contexts = {}
+_tls_lock = threading.Lock()
+
+def tls_context(pin_dir=None):
+    # The SSLContext both transports wrap their sockets with, shared by
+    # every session of the process. iDRACs ship self-signed certificates,
+    # so there is no CA verification; with pin_dir the SHA-256 fingerprint
+    # of each host's certificate is recorded there on first contact and
+    # any other certificate fails the handshake afterwards. The last TLS
+    # session of each host is offered again on its next connection, so
+    # connections after the first resume instead of doing a full
+    # handshake. The ssl module can't serialize sessions, so they last as
+    # long as the process.
+    if pin_dir:
+        pin_dir = os.path.expanduser(pin_dir)
+    with _tls_lock:
+        if pin_dir not in _tls_contexts:
+            _tls_contexts[pin_dir] = _pinning_context_class().create(pin_dir)
+        return _tls_contexts[pin_dir]
+
+_pinning_context = None
+
+def _pinning_context_class():
+    global _pinning_context
+    if _pinning_context is not None:
+        return _pinning_context
+    import ssl
+
+    class CertificatePinError(ssl.SSLError):
+        pass
+
+    class SessionSocket(ssl.SSLSocket):
+        # Hands its session back to the context when closed, as TLS 1.3
+        # only sends the tickets that make it resumable after the handshake.
+        # close() runs while the connection is still up, so the public
+        # session property still has it; sockets that are never closed are
+        # read from when the host's next connection is made.
+        _session_host = None
+
+        def close(self):
+            if self._session_host is not None:
+                self.context._session(self._session_host, closing=self)
+            super(SessionSocket, self).close()
+
+    class PinningContext(ssl.SSLContext):
+        sslsocket_class = SessionSocket
+
+        @classmethod
+        def create(cls, pin_dir):
+            context = cls(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            context.pin_dir = pin_dir
+            context._pins = {}
+            # host:port -> (last resumable session, last socket)
+            context._sessions = {}
+            context._state_lock = threading.Lock()
+            return context
+
+        def wrap_socket(self, sock, *args, **kwargs):
+            peer = sock.getpeername()
+            host = '%s:%d' % (kwargs.get('server_hostname') or peer[0], peer[1])
+            if kwargs.get('session') is None:
+                kwargs['session'] = self._session(host)
+            ssock = super(PinningContext, self).wrap_socket(sock, *args, **kwargs)
+            if not kwargs.get('do_handshake_on_connect', True):
+                return ssock
+            _conn_timing.resumed = ssock.session_reused
+            try:
+                self._check_pin(host, ssock.getpeercert(binary_form=True))
+            except Exception:
+                ssock.close()
+                raise
+            ssock._session_host = host
+            with self._state_lock:
+                self._sessions[host] = (self._sessions.get(host, (None, None))[0], ssock)
+            return ssock
+
+        def _session(self, host, closing=None):
+            # The host's last resumable session, taken from its last socket
+            # once that holds a ticket; the socket is let go when it closes
+            with self._state_lock:
+                (session, sock) = self._sessions.get(host, (None, None))
+                if sock is not None:
+                    current = sock.session
+                    if current is not None and (current.has_ticket or session is None):
+                        session = current
+                    self._sessions[host] = (session, None if sock is closing else sock)
+                return session
+
+        def _check_pin(self, host, der):
+            if not self.pin_dir:
+                return
+            if der is None:
+                raise CertificatePinError("%s presented no certificate" % host)
+            fingerprint = hashlib.sha256(der).hexdigest()
+            path = os.path.join(self.pin_dir, _host_key(host) + '.json')
+            with self._state_lock:
+                pinned = self._pins.get(host)
+                if pinned is None:
+                    try:
+                        with open(path) as f:
+                            pinned = json.load(f)['sha256'].replace(':', '').lower()
+                    except (IOError, OSError) as e:
+                        if os.path.exists(path):
+                            raise CertificatePinError("Can't read the pinned certificate of %s: %s" % (host, e))
+                    except (ValueError, KeyError, AttributeError) as e:
+                        raise CertificatePinError("Invalid pinned certificate %s: %s" % (path, e))
+                    if pinned is None:
+                        # Trust on first use
+                        pinned = fingerprint
+                        if not os.path.isdir(self.pin_dir):
+                            os.makedirs(self.pin_dir, 0o700)
+                        fd, tmp = tempfile.mkstemp(dir=self.pin_dir)
+                        with os.fdopen(fd, 'w') as f:
+                            json.dump({'sha256': fingerprint,
+                                       'pinned': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}, f)
+                        os.rename(tmp, path)
+                    self._pins[host] = pinned
+            if pinned != fingerprint:
+                raise CertificatePinError("Certificate of %s doesn't match the pinned one: sha256 %s, pinned %s; "
+                                          "remove %s if the iDRAC's certificate was replaced"
+                                          % (host, fingerprint, pinned, path))
+
+    _pinning_context = PinningContext
+    return _pinning_context
+
+def _httplib():
+    try:
+        import http.client as httplib
+    except ImportError:
+        import httplib
+    return httplib
+
+class HTTPClientError(IOError):
+    # Errors of the http.client transport in place of the requests
+    # exceptions: ConnectError when the request never left this host,
+    # TLSError for a failed handshake, ReadTimeout while waiting for the
+    # response
+    pass
+
+class HTTPClientConnectError(HTTPClientError):
+    pass
+
+class HTTPClientTLSError(HTTPClientError):
+    pass
+
+class HTTPClientReadTimeout(HTTPClientError):
+    pass
+
+class HTTPClientResponse(object):
+    # The parts of requests.Response the iDRAC class uses. The body is read
+    # on first access to content, then the connection goes back to the
+    # session's pool.
+    def __init__(self, session, key, conn, response, stream):
+        self.status_code = response.status
+        self.headers = response.msg
+        self._session = session
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._content = None
+        if not stream:
+            self.content
+
+    @property
+    def content(self):
+        if self._content is None:
+            try:
+                body = self._response.read()
+            except socket.timeout as e:
+                self.close()
+                raise HTTPClientReadTimeout("Read timed out: %s" % e)
+            except (_httplib().HTTPException, IOError, OSError) as e:
+                self.close()
+                raise HTTPClientError("Connection broken: %r" % e)
+            if (self.headers.get('Content-Encoding') or '').lower() == 'gzip':
+                body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+            self._content = body
+            self._release()
+        return self._content
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+    def iter_content(self, chunk_size=1):
+        # The body in chunks as it arrives, gunzipped, for parsing it
+        # without holding all of it
+        if self._content is not None:
+            yield self._content
+            return
+        decompress = None
+        if (self.headers.get('Content-Encoding') or '').lower() == 'gzip':
+            import zlib
+            decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                yield decompress(chunk) if decompress else chunk
+        except socket.timeout as e:
+            self.close()
+            raise HTTPClientReadTimeout("Read timed out: %s" % e)
+        except (_httplib().HTTPException, IOError, OSError) as e:
+            self.close()
+            raise HTTPClientError("Connection broken: %r" % e)
+        self._release()
+
+    def iter_lines(self, decode_unicode=False):
+        # Line by line as the iDRAC sends them, for event streams
+        try:
+            while True:
+                line = self._response.readline()
+                if not line:
+                    break
+                line = line.rstrip(b'\r\n')
+                yield line.decode('utf-8', 'replace') if decode_unicode else line
+        except socket.timeout as e:
+            raise HTTPClientReadTimeout("Read timed out: %s" % e)
+        except (_httplib().HTTPException, IOError, OSError) as e:
+            raise HTTPClientError("Connection broken: %r" % e)
+
+    def _release(self):
+        if self._conn is not None:
+            if self._response.will_close:
+                self._conn.close()
+            else:
+                self._session._put(self._key, self._conn)
+            self._conn = None
+
+    def close(self):
+        # Closed before the body was read, the connection is in an unknown
+        # state and is dropped instead of reused
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class HTTPClientSession(object):
+    # Keep-alive HTTP(S) transport on the standard library's http.client
+    # with the subset of the requests.Session interface the iDRAC class
+    # uses. Idle connections are pooled per scheme and host, up to
+    # pool_maxsize. Certificates are only checked against the pins of
+    # ssl_context, as with verify=False, and proxy settings from the
+    # environment are not used.
+    def __init__(self, pool_maxsize, ssl_context):
+        self.headers = {}
+        self._pool_maxsize = pool_maxsize
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._context = ssl_context
+
+    def _get(self, key):
+        # The most recently used idle connection that the server hasn't
+        # closed meanwhile; a readable idle socket means it has
+        import select
+        while True:
+            with self._pool_lock:
+                for i in range(len(self._idle) - 1, -1, -1):
+                    if self._idle[i][0] == key:
+                        conn = self._idle.pop(i)[1]
+                        break
+                else:
+                    return None
+            try:
+                if conn.sock is not None and not select.select([conn.sock], [], [], 0)[0]:
+                    return conn
+            except (IOError, OSError, ValueError):
+                pass
+            conn.close()
+
+    def _put(self, key, conn):
+        with self._pool_lock:
+            self._idle.append((key, conn))
+            if len(self._idle) > self._pool_maxsize:
+                self._idle.pop(0)[1].close()
+
+    def _connect(self, scheme, netloc, timeout):
+        import ssl
+        httplib = _httplib()
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(netloc, timeout=timeout[0], context=self._context)
+        else:
+            conn = httplib.HTTPConnection(netloc, timeout=timeout[0])
+        create_connection = conn._create_connection
+
+        def timed_create_connection(*args, **kwargs):
+            start = time.time()
+            sock = create_connection(*args, **kwargs)
+            _conn_timing.tcp = time.time() - start
+            return sock
+        conn._create_connection = timed_create_connection
+        start = time.time()
+        try:
+            conn.connect()
+        except socket.timeout as e:
+            conn.close()
+            raise HTTPClientConnectError("Connection to %s timed out: %s" % (netloc, e))
+        except ssl.SSLError as e:
+            conn.close()
+            raise HTTPClientTLSError("TLS handshake with %s failed: %s" % (netloc, e))
+        except (IOError, OSError) as e:
+            conn.close()
+            raise HTTPClientConnectError("Failed to connect to %s: %s" % (netloc, e))
+        _conn_timing.connect = time.time() - start
+        conn.sock.settimeout(timeout[1])
+        return conn
+
+    def request(self, method, url, headers=None, data=None, auth=None, timeout=None,
+                stream=False, verify=False):
+        try:
+            from urllib.parse import urlsplit
+        except ImportError:
+            from urlparse import urlsplit
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        merged = {'accept': '*/*', 'accept-encoding': 'gzip', 'user-agent': 'ansible-idrac'}
+        for extra in (self.headers, headers or {}):
+            for (name, value) in extra.items():
+                merged[name.lower()] = value
+        if auth:
+            credentials = ('%s:%s' % auth).encode('utf-8')
+            merged['authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+        if data is not None and not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        conn = self._get(key)
+        if conn is None:
+            conn = self._connect(parts.scheme, parts.netloc, timeout)
+        else:
+            conn.sock.settimeout(timeout[1])
+        try:
+            conn.request(method, path, body=data, headers=merged)
+            response = conn.getresponse()
+        except socket.timeout as e:
+            conn.close()
+            raise HTTPClientReadTimeout("Read timed out: %s" % e)
+        except (_httplib().HTTPException, IOError, OSError) as e:
+            conn.close()
+            raise HTTPClientError("Connection broken: %r" % e)
+        return HTTPClientResponse(self, key, conn, response, stream)
+
+    def close(self):
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for (key, conn) in idle:
+            conn.close()
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
+
+# Requests in flight per iDRAC across every client of this process (fleet
+# threads, member fan-out), so the BMC's session limit is never exceeded
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+# Marks the worker threads of _run_parallel(), where iDRAC.fail() raises
+# iDRACError instead of calling fail_json: fail_json prints the result and
+# exits, which several threads at once would each do
+_worker_state = threading.local()
+
+def _run_parallel(func, items, workers):
+    # [func(item) for item in items] in up to `workers` threads. Every
+    # item is run to the end before the first exception, in item order,
+    # is raised again in the calling thread.
+    def call(item):
+        _worker_state.active = True
+        try:
+            return func(item)
+        finally:
+            _worker_state.active = False
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(call, item) for item in items]
+    finally:
+        pool.shutdown()
+    return [future.result() for future in futures]
+
+def _host_slot(host, size):
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(max(1, size))
+        return _host_slots[host]
+
+# Responses worth another attempt. POST and PATCH are only repeated when the
+# iDRAC refused them outright; anything else may already have been applied.
+RETRY_STATUS = {'GET': (429, 500, 502, 503, 504),
+                'HEAD': (429, 500, 502, 503, 504),
+                'DELETE': (429, 500, 502, 503, 504),
+                'POST': (429, 503),
+                'PATCH': (429, 503)}
+
+def _retry_after(value):
+    # Retry-After is either delay seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        import email.utils
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, email.utils.mktime_tz(parsed) - time.time())
 
 class iDRAC(object):
     def __init__(self, module):
         self.module = module
-        root_uri = ''.join(["https://%s" % module.params['idracip'] , "/redfish/v1"])
-        self.system_uri = root_uri + "/Systems/System.Embedded.1"
-        self.chassis_uri = root_uri + "/Chassis/System.Embedded.1"
-        self.manager_uri = root_uri + "/Managers/iDRAC.Embedded.1"
+        self.base_uri = "https://%s" % module.params['idracip']
+        root_uri = ''.join([self.base_uri, "/redfish/v1"])
+        self.root_uri = root_uri
+        self.system_uri = root_uri + "/Systems/%s" % (module.params['system_id'] or "System.Embedded.1")
+        self.chassis_uri = root_uri + "/Chassis/%s" % (module.params['chassis_id'] or "System.Embedded.1")
+        self.manager_uri = root_uri + "/Managers/%s" % (module.params['manager_id'] or "iDRAC.Embedded.1")
+        # Default member URIs that may still be replaced by discovery, see
+        # _resolve_member()
+        self._member_defaults = set(attr for (attr, (collection, param)) in MEMBER_COLLECTIONS.items()
+                                    if not module.params[param])
         self.eventsvc_uri = root_uri + "/EventService"
         self.session_uri = root_uri + "/Sessions"
         self.tasksvc_uri = root_uri + "/TaskService"
         self.updatesvc_uri = root_uri + "/UpdateService"
+        # Optional on-disk response cache shared by every task that talks
+        # to this iDRAC, one directory per host
+        self.cache_dir = None
+        cache_dir = module.params['cache_dir'] or module.params['snapshot_dir']
+        if cache_dir:
+            self.cache_dir = os.path.join(os.path.expanduser(cache_dir), _host_key(module.params['idracip']))
+        # Resources fetched during this invocation, keyed by URI, so that
+        # several commands reading the same resource cost a single GET.
+        self._resources = {}
+        self._partial = set()
+        self._features = None
+        # Getters ask for single properties, so $select is only used while
+        # prefetch() reads the union of what a whole batch needs
+        self.use_select = False
+        self.request_count = 0
+        # Ids of the iDRAC jobs started by this invocation's actions
+        self.created_jobs = []
+        # Collection members are fetched by up to max_concurrency threads,
+        # each of which needs its own pooled connection.
+        pool_maxsize = max(module.params['pool_maxsize'], module.params['max_concurrency'])
+        # Per request timing records, None when instrumentation is off
+        self.timings = None
+        self.started = time.time()
+        if module.params['timings'] or module.params['trace_file']:
+            self.timings = []
+        # One keep-alive connection pool for every request of this
+        # invocation instead of a new TCP+TLS handshake per call.
+        context = tls_context(module.params['pin_dir'])
+        if module.params['transport'] == 'http.client':
+            self.session = HTTPClientSession(pool_maxsize, context)
+            self.errors = HTTPClientError
+        else:
+            import requests
+            self.session = requests.Session()
+            self.errors = requests.exceptions.RequestException
+            adapter = http_adapter(self.timings is not None)(ssl_context=context, pool_connections=1,
+                                                             pool_maxsize=pool_maxsize)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        self.auth_token = None
+        self.auth_session_uri = None
+        self._lock = threading.RLock()
+        # Separate from _lock, which login() holds while waiting for a
+        # request slot that a thread recording its timing may hold
+        self._timings_lock = threading.Lock()
+        self.timeout = (module.params['connect_timeout'], module.params['read_timeout'])
+        self._slot = _host_slot(module.params['idracip'], module.params['max_concurrency'])
         
-    def send_get_request(self, uri):
+    def login(self):
+        # Open a Redfish session once; the X-Auth-Token then replaces basic
+        # auth so the iDRAC doesn't re-check the credentials on every call.
+        payload = {'UserName': self.module.params['idracuser'], 'Password': self.module.params['idracpswd']}
+        headers = {'content-type': 'application/json'}
+        response = self._send('POST', self.session_uri, data=json.dumps(payload), headers=headers)
+        if response.status_code not in (200, 201):
+            self.fail("Redfish session login failed. Error code:%s" % response.status_code)
+        if not response.headers.get('X-Auth-Token'):
+            self.fail("Redfish session login failed: no X-Auth-Token in the response of %s" % self.session_uri)
+        self.auth_token = response.headers['X-Auth-Token']
+        self.auth_session_uri = response.headers.get('Location')
+        if self.auth_session_uri and self.auth_session_uri.startswith('/'):
+            self.auth_session_uri = self.base_uri + self.auth_session_uri
+        self.session.headers['X-Auth-Token'] = self.auth_token
+    
+    def logout(self):
+        if self.auth_session_uri:
+            try:
+                self._send('DELETE', self.auth_session_uri)
+            except self.errors:
+                pass
+        self.auth_token = None
+        self.auth_session_uri = None
+        self.session.headers.pop('X-Auth-Token', None)
+    
+    def close(self):
+        if self.auth_token:
+            self.logout()
+        self.session.close()
+        if self.module.params['trace_file'] and self.timings is not None:
+            self.write_trace(self.module.params['trace_file'])
+    
+    def fail(self, msg):
+        # fail_json that keeps the timings gathered so far, which are most
+        # wanted when a request failed. In the threads of _run_parallel()
+        # it raises iDRACError, for the calling thread to report once.
+        if getattr(_worker_state, 'active', False):
+            raise iDRACError(msg)
+        if self.timings is not None and self.module.params['timings']:
+            self.module.fail_json(msg=msg, timings=self.timings)
+        self.module.fail_json(msg=msg)
+    
+    def _send(self, method, uri, **kwargs):
+        # One HTTP request, repeated up to `retries` times on throttling,
+        # server errors and dropped connections with jittered exponential
+        # backoff, or after Retry-After when the iDRAC sends one
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            with self._lock:
+                self.request_count += 1
+            try:
+                with self._slot:
+                    response = self._request(method, uri, **kwargs)
+            except self.errors as e:
+                if attempt >= self.module.params['retries'] or not self._retryable(method, e):
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if attempt >= self.module.params['retries'] or \
+                        response.status_code not in RETRY_STATUS.get(method, ()):
+                    return response
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+    
+    def _request(self, method, uri, **kwargs):
+        # verify is passed per request: a Session-level setting would be
+        # overridden by REQUESTS_CA_BUNDLE from the environment
+        if self.timings is None:
+            return self.session.request(method, uri, verify=False, **kwargs)
+        return self._timed_send(method, uri, **kwargs)
+    
+    def _retryable(self, method, error):
+        if isinstance(error, HTTPClientError):
+            if isinstance(error, HTTPClientTLSError):
+                return False
+            # A connection that was never made can't have delivered the
+            # request; anything else only for methods that may be repeated
+            return isinstance(error, HTTPClientConnectError) or method not in ('POST', 'PATCH')
+        import requests
+        from requests.packages.urllib3.exceptions import NewConnectionError
+        if isinstance(error, requests.exceptions.SSLError):
+            return False
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if method in ('POST', 'PATCH'):
+            # Only when the connection was never made, so the request
+            # can't have reached the iDRAC
+            reason = getattr(error.args[0], 'reason', None) if error.args else None
+            return isinstance(reason, NewConnectionError)
+        return isinstance(error, (requests.exceptions.ConnectionError,
+                                  requests.exceptions.ReadTimeout,
+                                  requests.exceptions.ChunkedEncodingError))
+    
+    def _backoff(self, attempt, retry_after=None):
+        limit = self.module.params['retry_backoff_max']
+        delay = _retry_after(retry_after)
+        if delay is None:
+            delay = random.uniform(0, self.module.params['retry_backoff'] * (2 ** attempt))
+        return min(delay, limit)
+    
+    def _timed_send(self, method, uri, **kwargs):
+        # The body is streamed so that the time to the response headers and
+        # the download time are measured apart; callers that stream
+        # themselves (event streams) only get the first of the two
+        stream = kwargs.pop('stream', False)
+        _conn_timing.tcp = _conn_timing.connect = _conn_timing.resumed = None
+        start = time.time()
+        record = {'method': method, 'uri': uri, 'start': start}
         try:
-            response = requests.get(uri, verify=False, auth=(self.module.params['idracuser'], self.module.params['idracpswd']))
-            
-        except:
+            response = self.session.request(method, uri, verify=False, stream=True, **kwargs)
+            record['ttfb'] = _ms(time.time() - start)
+            record['status'] = response.status_code
+            if not stream:
+                mark = time.time()
+                record['bytes'] = len(response.content)
+                record['download'] = _ms(time.time() - mark)
+            response.timing = record
+            return response
+        except self.errors as e:
+            record['error'] = "%s: %s" % (type(e).__name__, e)
+            raise
+        finally:
+            tcp = getattr(_conn_timing, 'tcp', None)
+            connect = getattr(_conn_timing, 'connect', None)
+            record['connect'] = _ms(tcp or 0)
+            record['tls'] = _ms(max(0, (connect or 0) - (tcp or 0)) if uri.startswith('https') else 0)
+            if getattr(_conn_timing, 'resumed', None) is not None:
+                record['tls_resumed'] = _conn_timing.resumed
+            record['total'] = _ms(time.time() - start)
+            with self._timings_lock:
+                self.timings.append(record)
+    
+    def _decode(self, response):
+        # response.json(), adding the decode time to the request's record
+        record = getattr(response, 'timing', None)
+        start = time.time()
+        try:
+            return response.json()
+        finally:
+            if record is not None:
+                record['decode'] = _ms(time.time() - start)
+                record['total'] = round(record['total'] + record['decode'], 3)
+    
+    def trace_spans(self):
+        # OTLP/JSON encoding of the timings: one client span per request
+        # below a root span covering the whole invocation
+        def attr(key, value):
+            if isinstance(value, bool):
+                return {'key': key, 'value': {'boolValue': value}}
+            if isinstance(value, int):
+                return {'key': key, 'value': {'intValue': str(value)}}
+            if isinstance(value, float):
+                return {'key': key, 'value': {'doubleValue': value}}
+            return {'key': key, 'value': {'stringValue': str(value)}}
+
+        def span_id(size=8):
+            return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+        def nanos(seconds):
+            return str(int(seconds * 1e9))
+
+        trace_id = span_id(16)
+        root_id = span_id()
+        host = self.module.params['idracip']
+        cmds = self.module.params['cmd'] or []
+        spans = [{'traceId': trace_id,
+                  'spanId': root_id,
+                  'name': "idrac %s %s" % (self.module.params['subsystem'], ','.join(cmds)),
+                  'kind': 1,
+                  'startTimeUnixNano': nanos(self.started),
+                  'endTimeUnixNano': nanos(time.time()),
+                  'attributes': [attr('server.address', host),
+                                 attr('idrac.subsystem', self.module.params['subsystem']),
+                                 attr('idrac.requests', self.request_count)]}]
+        for record in self.timings:
+            path = record['uri'][len(self.base_uri):] if record['uri'].startswith(self.base_uri) else record['uri']
+            attributes = [attr('http.request.method', record['method']),
+                          attr('url.full', record['uri']),
+                          attr('server.address', host)]
+            for key in ('connect', 'tls', 'ttfb', 'download', 'decode'):
+                if key in record:
+                    attributes.append(attr('idrac.%s_ms' % key, record[key]))
+            if 'tls_resumed' in record:
+                attributes.append(attr('idrac.tls_resumed', record['tls_resumed']))
+            if 'status' in record:
+                attributes.append(attr('http.response.status_code', record['status']))
+            if 'bytes' in record:
+                attributes.append(attr('http.response.body.size', record['bytes']))
+            failed = 'error' in record or record.get('status', 0) >= 400
+            if 'error' in record:
+                attributes.append(attr('error.type', record['error'].split(':', 1)[0]))
+            elif failed:
+                attributes.append(attr('error.type', str(record['status'])))
+            spans.append({'traceId': trace_id,
+                          'spanId': span_id(),
+                          'parentSpanId': root_id,
+                          'name': "%s %s" % (record['method'], path.split('?', 1)[0]),
+                          'kind': 3,
+                          'startTimeUnixNano': nanos(record['start']),
+                          'endTimeUnixNano': nanos(record['start'] + record['total'] / 1000.0),
+                          'attributes': attributes,
+                          'status': {'code': 2, 'message': record.get('error', '')} if failed else {}})
+        return {'resourceSpans': [{
+            'resource': {'attributes': [attr('service.name', 'ansible-idrac'), attr('host.name', host)]},
+            'scopeSpans': [{'scope': {'name': 'idrac'}, 'spans': spans}]}]}
+    
+    def write_trace(self, path):
+        # One JSON document per line; a single append keeps lines from
+        # concurrent tasks and fleet threads whole
+        line = (json.dumps(self.trace_spans(), sort_keys=True) + '\n').encode('utf-8')
+        with _trace_lock:
+            fd = os.open(os.path.expanduser(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+    
+    def send_request(self, method, uri, **kwargs):
+        try:
+            return self._send_authorized(method, uri, **kwargs)
+        except self.errors as e:
+            self.fail("%s %s failed: %s" % (method, uri, e))
+    
+    def session_token(self):
+        # Log in unless a session is already open
+        with self._lock:
+            if not self.auth_token:
+                self.login()
+            return self.auth_token
+    
+    def _send_authorized(self, method, uri, **kwargs):
+        if self.module.params['auth_mode'] == 'session':
+            token = self.session_token()
+        else:
+            kwargs['auth'] = (self.module.params['idracuser'], self.module.params['idracpswd'])
+        response = self._send(method, uri, **kwargs)
+        if response.status_code == 401 and self.module.params['auth_mode'] == 'session':
+            # The session timed out on the iDRAC (long running collectors);
+            # log in again once, unless another thread already did
+            with self._lock:
+                if self.auth_token == token:
+                    self.auth_token = None
+                    self.auth_session_uri = None
+                    self.login()
+            response = self._send(method, uri, **kwargs)
+        if response.status_code == 404:
+            member_uri = self._resolve_member(method, uri)
+            if member_uri:
+                response.close()
+                return self._send_authorized(method, member_uri, **kwargs)
+        return response
+    
+    def members(self, collection):
+        # Member URIs of the Systems, Chassis or Managers collection,
+        # discovered once per iDRAC and process
+        key = (self.base_uri, collection)
+        if key not in _members:
+            uri = self.root_uri + u'/' + collection
+            resp = self.check_response(uri, self._get(uri))
+            with _members_lock:
+                _members[key] = [self.base_uri + m[u'@odata.id'] for m in resp.get(u'Members', [])]
+        return _members[key]
+    
+    def _resolve_member(self, method, uri):
+        # uri answered 404. When it lies below a default member URI this
+        # iDRAC doesn't have (an MX chassis manager, a multi-node sled), a
+        # GET switches to the only member of the collection and returns uri
+        # rewritten for it. With several members, or for a POST or PATCH,
+        # a guess could act on the wrong sled, so it fails naming the
+        # members instead. None otherwise. Each default is checked once.
+        for attr in sorted(self._member_defaults):
+            current = getattr(self, attr)
+            if uri == current or uri.startswith((current + u'/', current + u'?')):
+                self._member_defaults.discard(attr)
+                (collection, param) = MEMBER_COLLECTIONS[attr]
+                members = self.members(collection)
+                if not members or current in members:
+                    return None
+                if method in ('GET', 'HEAD') and len(members) == 1:
+                    setattr(self, attr, members[0])
+                    return members[0] + uri[len(current):]
+                self.fail("%s has no member %s; set %s to one of %s, or use all_members"
+                          % (collection, current.rsplit(u'/', 1)[-1], param,
+                             u', '.join(m.rsplit(u'/', 1)[-1] for m in members)))
+        return None
+    
+    def cache_ttl(self, uri):
+        # The most specific cache_resource_ttl entry wins over cache_ttl.
+        # Change detection must see every change, so only the service root
+        # may come from the cache unasked.
+        if self.module.params['snapshot_dir'] and uri != self.root_uri:
+            return 0
+        ttl = self.module.params['cache_ttl']
+        best = ''
+        for path, value in (self.module.params['cache_resource_ttl'] or {}).items():
+            prefix = self.root_uri + '/' + path.strip('/')
+            if uri == prefix or uri.startswith(prefix + '/') or uri.startswith(prefix + '?'):
+                if len(prefix) > len(best):
+                    best, ttl = prefix, value
+        return int(ttl)
+    
+    def _cache_path(self, uri):
+        return os.path.join(self.cache_dir, hashlib.sha1(uri.encode('utf-8')).hexdigest() + '.json')
+    
+    def _cache_load(self, uri):
+        try:
+            with open(self._cache_path(uri)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+    
+    def _cache_store(self, uri, entry):
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, 0o700)
+            # Write then rename so concurrent tasks never read half a file
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(tmp, self._cache_path(uri))
+        except (IOError, OSError):
             pass
-        return response.json()
+    
+    def invalidate_cache(self):
+        if self.cache_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def _cache_fresh(self, uri):
+        if not self.cache_dir:
+            return False
+        entry = self._cache_load(uri)
+        return entry is not None and time.time() - entry['time'] < self.cache_ttl(uri)
+    
+    def _get(self, uri, cache=True):
+        entry = None
+        headers = {}
+        cache = cache and self.cache_dir
+        if cache:
+            entry = self._cache_load(uri)
+            if entry is not None:
+                if time.time() - entry['time'] < self.cache_ttl(uri):
+                    return entry['body']
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+        response = self.send_request('GET', uri, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            body = entry['body']
+            etag = entry['etag']
+        else:
+            try:
+                body = self._decode(response)
+            except ValueError:
+                self.fail("GET %s returned HTTP %s without a JSON body" % (uri, response.status_code))
+            etag = response.headers.get('ETag') or body.get(u'@odata.etag')
+        if cache and response.status_code in (200, 304):
+            self._cache_store(uri, {'time': time.time(), 'etag': etag, 'body': body})
+        return body
+    
+    def send_get_request(self, uri, select=None):
+        # select names the top-level properties the caller needs. They are
+        # requested with $select when the iDRAC supports it and the service
+        # root is already known, so the probe never costs an extra GET.
+        cached = self._resources.get(uri)
+        if cached is not None:
+            if uri not in self._partial:
+                return cached
+            if select and all(f in cached for f in select.split(',')):
+                return cached
+        if select and not (self.use_select and self.root_known() and self.supports_select()):
+            select = None
+        if select:
+            resp = self._get(uri + u'?$select=' + select)
+            if 'error' in resp:
+                return resp
+            merged = dict(cached or {})
+            merged.update(resp)
+            self._resources[uri] = merged
+            self._partial.add(uri)
+            return merged
+        self._resources[uri] = self._get(uri)
+        self._partial.discard(uri)
+        return self._resources[uri]
+    
+    def forget_resources(self):
+        # Drop what this client has read so far, for clients kept open to
+        # read the same resources again later (exporters)
+        self._resources.clear()
+        self._partial.clear()
     
     def send_post_request(self,uri, pyld, hdrs):
-        try:
-            response = requests.post(uri, data=json.dumps(pyld), headers=hdrs,verify=False, auth=(self.module.params['idracuser'], self.module.params['idracpswd']))
-        except:
-            raise   
-        
+        # Actions change server state, so anything read so far is stale
+        self._resources.clear()
+        self.invalidate_cache()
+        response = self.send_request('POST', uri, data=json.dumps(pyld), headers=hdrs)
+        self._note_job(response)
         return str(response.status_code)
     
     def send_patch_request(self,uri, pyld, hdrs):
-        try:
-            response = requests.patch(uri, data=json.dumps(pyld), headers=hdrs,verify=False, auth=(self.module.params['idracuser'], self.module.params['idracpswd']))
-        except:
-            raise   
-        
+        self._resources.clear()
+        self.invalidate_cache()
+        response = self.send_request('PATCH', uri, data=json.dumps(pyld), headers=hdrs)
+        self._note_job(response)
         return str(response.status_code)
+    
+    def _note_job(self, response):
+        # Actions that start an iDRAC job answer with the job's URI in
+        # Location; WaitJobs later in the batch picks it up
+        location = response.headers.get('Location', '')
+        job_id = os.path.basename(location.rstrip('/'))
+        if job_id.startswith(('JID_', 'RID_')) or '/Jobs/' in location:
+            self.created_jobs.append(job_id)
+    
+    def fetch_resources(self, uris, cache=True):
+        # GET several resources at once, never holding more than
+        # max_concurrency requests open against the iDRAC, which only
+        # serves a handful of concurrent sessions. cache=False is for live
+        # readings that must not come from the memo or the disk cache.
+        fetch = self.send_get_request if cache else (lambda uri: self._get(uri, cache=False))
+        workers = min(self.module.params['max_concurrency'], len(uris))
+        if workers <= 1:
+            return [fetch(uri) for uri in uris]
+        try:
+            return _run_parallel(fetch, uris, workers)
+        except iDRACError as e:
+            self.fail(str(e))
+    
+    def prefetch(self, plan):
+        # plan maps resource attributes to the properties a batch of
+        # commands needs (see plan_fetch); each resource is read once and
+        # the getters then find their properties in the memo
+        use_select, self.use_select = self.use_select, True
+        try:
+            for attr in sorted(plan):
+                self.send_get_request(getattr(self, attr), select=','.join(sorted(plan[attr])) or None)
+        finally:
+            self.use_select = use_select
+    
+    def get_protocol_features(self):
+        # ProtocolFeaturesSupported from the service root, read once
+        if self._features is None:
+            self._features = {}
+            if self.module.params['odata_query']:
+                resp = self.send_get_request(self.root_uri)
+                self._features = resp.get(u'ProtocolFeaturesSupported') or {}
+        return self._features
+    
+    def root_known(self):
+        if self._features is None and self._cache_fresh(self.root_uri):
+            self.get_protocol_features()
+        return self._features is not None
+    
+    def supports_expand(self):
+        expand = self.get_protocol_features().get(u'ExpandQuery') or {}
+        return bool(expand.get(u'ExpandAll') and expand.get(u'Levels'))
+    
+    def supports_select(self):
+        return bool(self.get_protocol_features().get(u'SelectQuery'))
+    
+    def get_collection(self, uri):
+        # Members of a Redfish collection, each one fetched in full. Firmware
+        # that supports $expand returns them all in one response; anything
+        # else falls back to one GET per member.
+        if self.supports_expand():
+            resp = self.send_get_request(uri + u'?$expand=*($levels=1)')
+            if u'Members' in resp and all(len(i) > 1 for i in resp[u'Members']):
+                return resp[u'Members']
+        resp = self.check_response(uri, self.send_get_request(uri))
+        members = self.fetch_resources([self.base_uri + i[u'@odata.id'] for i in resp[u'Members']])
+        # A member still refused after the retries would otherwise go
+        # missing from the inventory without a word
+        return [self.check_response(uri, member) for member in members]
+    
+    def iter_members(self, uri, tail=None):
+        # Members of the collection or log page at uri, parsed while the
+        # response arrives: expanded inventories and long log pages can be
+        # tens of MB, of which only one member is held at a time. The other
+        # properties, like Members@odata.nextLink, are put in tail. Never
+        # cached.
+        tail = {} if tail is None else tail
+        response = self.send_request('GET', uri, stream=True)
+        try:
+            for member in _iter_json_members(response.iter_content(65536), tail=tail):
+                yield member
+        except ValueError:
+            self.fail("GET %s returned HTTP %s without a JSON body" % (uri, response.status_code))
+        except self.errors as e:
+            self.fail("GET %s failed: %s" % (uri, e))
+        finally:
+            response.close()
+        self.check_response(uri, tail)
+
+    def iter_collection(self, uri):
+        # get_collection() for callers that look at each member once: an
+        # $expand response is parsed member by member instead of whole.
+        # With the response cache, or once the collection has been read
+        # in this run, it is get_collection() after all.
+        expanded = uri + u'?$expand=*($levels=1)'
+        if self.cache_dir or expanded in self._resources or not self.supports_expand():
+            for member in self.get_collection(uri):
+                yield member
+            return
+        links = []
+        for member in self.iter_members(expanded):
+            if len(member) > 1:
+                yield member
+            else:
+                links.append(self.base_uri + member[u'@odata.id'])
+        # Members the iDRAC didn't expand are read the usual way
+        for member in self.fetch_resources(links):
+            yield self.check_response(uri, member)
+
+    def check_response(self, uri, resp):
+        # Fail on a Redfish error body, return the resource otherwise
+        if 'error' in resp:
+            info = resp['error'].get('@Message.ExtendedInfo') or [resp['error']]
+            self.fail("Reading %s failed: %s" % (uri, info[0].get('Message')))
+        return resp
+    def _render(self, value, text=None):
+        # A getter's result: the native value, without @odata annotations,
+        # in structured output mode, else the string the module always
+        # returned, which is str(value) unless the getter passes text
+        if self.module.params['output'] == 'structured':
+            return _strip_odata(value)
+        return str(value) if text is None else text
+    
     def get_system_health(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'Status'][u'Health'])
+        resp = self.send_get_request(self.system_uri, select=u'Status')
+        return self._render(resp[u'Status'][u'Health'])
     
     def get_system_serial_number(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'SerialNumber'])
+        resp = self.send_get_request(self.system_uri, select=u'SerialNumber')
+        return self._render(resp[u'SerialNumber'])
     
     def get_system_service_tag(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'SKU'])
+        resp = self.send_get_request(self.system_uri, select=u'SKU')
+        return self._render(resp[u'SKU'])
     
     def get_server_part_number(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'PartNumber'])
+        resp = self.send_get_request(self.system_uri, select=u'PartNumber')
+        return self._render(resp[u'PartNumber'])
     
     def get_system_Manufacturer(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'Manufacturer'])
+        resp = self.send_get_request(self.system_uri, select=u'Manufacturer')
+        return self._render(resp[u'Manufacturer'])
     
     def get_system_bios_version(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'BiosVersion'])
+        resp = self.send_get_request(self.system_uri, select=u'BiosVersion')
+        return self._render(resp[u'BiosVersion'])
     
     def get_system_type(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'SystemType'])
+        resp = self.send_get_request(self.system_uri, select=u'SystemType')
+        return self._render(resp[u'SystemType'])
     
     def get_system_power_state(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'PowerState'])
+        resp = self.send_get_request(self.system_uri, select=u'PowerState')
+        return self._render(resp[u'PowerState'])
     
     def get_system_memory_health(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'MemorySummary'][u'Status'][u'Health'])
+        resp = self.send_get_request(self.system_uri, select=u'MemorySummary')
+        return self._render(resp[u'MemorySummary'][u'Status'][u'Health'])
     
     def get_system_memory_in_GB(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'MemorySummary'][u'TotalSystemMemoryGiB'])
+        resp = self.send_get_request(self.system_uri, select=u'MemorySummary')
+        return self._render(resp[u'MemorySummary'][u'TotalSystemMemoryGiB'])
     
     def get_processor_count(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'ProcessorSummary'][u'Count'])
+        resp = self.send_get_request(self.system_uri, select=u'ProcessorSummary')
+        return self._render(resp[u'ProcessorSummary'][u'Count'])
     
     def get_processor_health(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'ProcessorSummary'][u'Status'][u'Health'])
+        resp = self.send_get_request(self.system_uri, select=u'ProcessorSummary')
+        return self._render(resp[u'ProcessorSummary'][u'Status'][u'Health'])
     
     def get_processor_model(self):
-        resp = self.send_get_request(self.system_uri)
-        return str(resp[u'ProcessorSummary'][u'Model'])
+        resp = self.send_get_request(self.system_uri, select=u'ProcessorSummary')
+        return self._render(resp[u'ProcessorSummary'][u'Model'])
     
     def get_boot_sources(self):
         sources = []
@@ -193,36 +1554,36 @@ class iDRAC(object):
         if u'UefiBootSeq' in resp[u'Attributes']:
                 for i in resp[u'Attributes'][u'UefiBootSeq']:
                         sources.append(i[u'Name'])
-        return ",".join(str(x) for x in sources)
+        return self._render(sources, ",".join(str(x) for x in sources))
         
     def get_system_ethernet_interfaces(self):
         eth = []
         resp = self.send_get_request(self.system_uri + u'/EthernetInterfaces')
         for i in resp[u'Members']:
             eth.append(os.path.basename(i[u'@odata.id']))
-        return json.dumps(eth)
+        return self._render(eth, json.dumps(eth))
 
     def get_system_ethernet_permanent_MAC_address(self):
         resp = self.send_get_request(self.system_uri + u'/EthernetInterfaces/%s' % self.module.params[u'eth_interface'])
-        return resp[u'PermanentMACAddress']
+        return self._render(resp[u'PermanentMACAddress'])
     
     def get_system_secure_boot_status(self):
         resp = self.send_get_request(self.system_uri + u'/SecureBoot')
-        return resp[u'SecureBootCurrentBoot']
+        return self._render(resp[u'SecureBootCurrentBoot'])
     
     def get_system_secure_boot_certificates(self):
         cert = []
         resp = self.send_get_request(self.system_uri + u'/SecureBoot/Certificates')
         for i in resp[u'Members']:
             cert.append(os.path.basename(i[u'@odata.id']))
-        return ",".join(str(x) for x in cert)
+        return self._render(cert, ",".join(str(x) for x in cert))
     def get_system_cpus(self):
         cpus=[]
         resp = self.send_get_request(self.system_uri+u'/Processors')
         if not 'error' in resp.keys():
             for i in resp[u'Members']:
                 cpus.append("CPU%s"%(os.path.basename(i[u'@odata.id']).split('.')[2]))
-            return (json.dumps(cpus),None)
+            return (self._render(cpus, json.dumps(cpus)),None)
         return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
             
     def get_system_storage_controllers(self):
@@ -230,71 +1591,220 @@ class iDRAC(object):
         resp = self.send_get_request(self.system_uri + u'/Storage/Controllers')
         for i in resp[u'Members']:
             ctrls.append(os.path.basename(i[u'@odata.id']))
-        return json.dumps(ctrls)
+        return self._render(ctrls, json.dumps(ctrls))
         
         
     def get_system_storage_controller_disks(self):
         resp = self.send_get_request(self.system_uri + u'/Storage/Controllers/%s' % self.module.params[u'storage_controller'])
         if len(resp[u'Devices']) > 1:
-            return json.dumps(resp[u'Devices'])
+            return self._render(resp[u'Devices'], json.dumps(resp[u'Devices']))
         else:
-            return json.dumps([])
+            return self._render([], json.dumps([]))
+    
+    def get_storage_topology(self):
+        # Every storage subsystem (PERC, BOSS, NVMe) with its drives and
+        # volumes. After the Storage collection, the drives and volumes of
+        # all controllers are read in one concurrent round: with $expand
+        # that is one GET per controller and one per Volumes collection,
+        # without it one GET per drive plus the Volumes collections, and
+        # then a last round for the volumes themselves.
+        expand = u'?$expand=*($levels=1)' if self.supports_expand() else u''
+        storages = self.get_collection(self.system_uri + u'/Storage')
+        uris = []
+        for st in storages:
+            if expand:
+                uris.append(self.base_uri + st[u'@odata.id'] + expand)
+            else:
+                uris.extend(self.base_uri + d[u'@odata.id'] for d in st.get(u'Drives', []))
+            if u'Volumes' in st:
+                uris.append(self.base_uri + st[u'Volumes'][u'@odata.id'] + expand)
+        fetched = dict(zip(uris, self.fetch_resources(uris)))
+        # Links firmware didn't expand are fetched in one more round
+        members = {}
+        for st in storages:
+            drives = st.get(u'Drives', [])
+            if expand:
+                uri = self.base_uri + st[u'@odata.id']
+                drives = self.check_response(uri, fetched[uri + expand]).get(u'Drives', drives)
+            volumes = []
+            if u'Volumes' in st:
+                uri = self.base_uri + st[u'Volumes'][u'@odata.id']
+                volumes = self.check_response(uri, fetched[uri + expand]).get(u'Members', [])
+            members[st[u'@odata.id']] = (drives, volumes)
+        links = [self.base_uri + i[u'@odata.id'] for (drives, volumes) in members.values()
+                 for i in drives + volumes if len(i) == 1 and self.base_uri + i[u'@odata.id'] not in fetched]
+        fetched.update(zip(links, self.fetch_resources(links)))
+
+        def resolve(items):
+            return [i if len(i) > 1 else self.check_response(i[u'@odata.id'], fetched[self.base_uri + i[u'@odata.id']])
+                    for i in items]
+
+        def health(resource):
+            return (resource.get(u'Status') or {}).get(u'Health')
+
+        topology = {}
+        for st in storages:
+            (drives, volumes) = members[st[u'@odata.id']]
+            controllers = st.get(u'StorageControllers') or [{}]
+            node = {'Name': st.get(u'Name'),
+                    'Health': health(st),
+                    'Model': controllers[0].get(u'Model'),
+                    'FirmwareVersion': controllers[0].get(u'FirmwareVersion'),
+                    'Drives': {},
+                    'Volumes': {}}
+            for d in resolve(drives):
+                node['Drives'][d.get(u'Id') or os.path.basename(d[u'@odata.id'])] = {
+                    'Name': d.get(u'Name'),
+                    'Model': d.get(u'Model'),
+                    'SerialNumber': d.get(u'SerialNumber'),
+                    'CapacityBytes': d.get(u'CapacityBytes'),
+                    'MediaType': d.get(u'MediaType'),
+                    'Protocol': d.get(u'Protocol'),
+                    'Health': health(d),
+                    'FailurePredicted': d.get(u'FailurePredicted'),
+                    'LifeLeftPercent': d.get(u'PredictedMediaLifeLeftPercent')}
+            for v in resolve(volumes):
+                node['Volumes'][v.get(u'Id') or os.path.basename(v[u'@odata.id'])] = {
+                    'Name': v.get(u'Name'),
+                    'CapacityBytes': v.get(u'CapacityBytes'),
+                    'RAIDType': v.get(u'RAIDType') or v.get(u'VolumeType'),
+                    'Health': health(v),
+                    'Drives': [os.path.basename(i[u'@odata.id']) for i in (v.get(u'Links') or {}).get(u'Drives', [])]}
+            topology[st.get(u'Id') or os.path.basename(st[u'@odata.id'])] = node
+        return self._render(topology, json.dumps(topology, sort_keys=True))
     def system_reset(self):
         payload = {'ResetType': self.module.params[u'ResetType']}
         headers = {'content-type': 'application/json'}
         return self.send_post_request(self.system_uri+u'/Actions/ComputerSystem.Reset',payload,headers )
     def system_onetime(self):
-        payload = {'Boot': {'BootSourceOverrideTarget' : self.module.params[u'Target']}}
+        # Only PATCHed when the override isn't already set, so a repeated
+        # task neither writes nor reports changed
+        boot = {'BootSourceOverrideTarget': self.module.params[u'Target']}
+        if boot['BootSourceOverrideTarget'] != 'None':
+            boot['BootSourceOverrideEnabled'] = 'Once'
+        plan = self._config_plan([(self.system_uri, {'Boot': boot})])[0]
+        error = self._config_apply(plan)
+        if error:
+            return (None, "system OneTimeBoot setting failed. %s" % error)
+        return ('OK', None, bool(plan['diff']))
+    
+    def configure(self):
+        # attributes maps a target (CONFIG_TARGETS, or a path below
+        # /redfish/v1) to its desired state. Every target is read before
+        # anything is written, then only the properties that differ are
+        # written with one PATCH per resource; stdout lists them with their
+        # old and new values.
+        attributes = self.module.params['attributes']
+        targets = sorted(attributes)
+        wanted = []
+        for target in targets:
+            if target in CONFIG_TARGETS:
+                (attr, path, wrap) = CONFIG_TARGETS[target]
+                uri = getattr(self, attr) + path
+                wanted.append((uri, {u'Attributes': attributes[target]} if wrap else attributes[target]))
+            else:
+                wanted.append((self.root_uri + u'/' + target.strip('/'), attributes[target]))
+        out = {}
+        errors = []
+        changed = False
+        for (target, plan) in zip(targets, self._config_plan(wanted)):
+            error = self._config_apply(plan)
+            if error:
+                errors.append("%s: %s" % (target, error))
+            changed = changed or (bool(plan['diff']) and not error)
+            out[target] = plan['changes']
+        return (self._render(out, json.dumps(out, sort_keys=True)), "; ".join(errors), changed)
+    
+    def _config_plan(self, wanted):
+        # For each (uri, desired state): what differs and where to write it.
+        # A resource with @Redfish.Settings (BIOS, NIC attributes) is written
+        # through its settings object, leaving out what is already pending
+        # there. All resources are read at once, without the cache.
+        plans = []
+        settings = []
+        for ((uri, desired), current) in zip(wanted, self.fetch_resources([u for (u, d) in wanted], cache=False)):
+            current = self.check_response(uri, current)
+            diff = _config_diff(current, desired)
+            plan = {'uri': uri, 'diff': diff, 'changes': _config_changes(current, diff), 'settings': None}
+            settings_uri = ((current.get(u'@Redfish.Settings') or {}).get(u'SettingsObject') or {}).get(u'@odata.id')
+            if diff and settings_uri:
+                plan['settings'] = settings_uri
+                plan['uri'] = self.base_uri + settings_uri if settings_uri.startswith('/') else settings_uri
+                settings.append(plan)
+            plans.append(plan)
+        for (plan, pending) in zip(settings, self.fetch_resources([p['uri'] for p in settings], cache=False)):
+            plan['diff'] = _config_diff(self.check_response(plan['uri'], pending), plan['diff'])
+            for key in plan['changes']:
+                if not _config_has(plan['diff'], key):
+                    plan['changes'][key]['pending'] = True
+        return plans
+    
+    def _config_apply(self, plan):
+        # Write a _config_plan entry, plus the config job that applies a
+        # settings object at the next reboot. Nothing in check mode.
+        if not plan['diff'] or self.module.check_mode:
+            return None
         headers = {'content-type': 'application/json'}
-        return self.send_patch_request(self.system_uri,payload,headers )
+        status = self.send_patch_request(plan['uri'], plan['diff'], headers)
+        if status not in ('200', '202', '204'):
+            return "PATCH %s failed. Error code:%s" % (plan['uri'], status)
+        if plan['settings']:
+            jobs = len(self.created_jobs)
+            status = self.send_post_request(self.manager_uri + u'/Jobs', {'TargetSettingsURI': plan['settings']}, headers)
+            if status not in ('200', '201', '202'):
+                return "Creating the config job for %s failed. Error code:%s" % (plan['settings'], status)
+            for change in plan['changes'].values():
+                if len(self.created_jobs) > jobs and not change.get('pending'):
+                    change['job'] = self.created_jobs[-1]
+        return None
     
     # Redfish Chassis API
     
     def get_chassis_health(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Status')
         if not 'error' in resp.keys():
-            return (str(resp[u'Status'][u'Health']),None)
+            return (self._render(resp[u'Status'][u'Health']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     def get_chassis_indicator_LED_status(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'IndicatorLED')
         if not 'error' in resp.keys():
-            return (str(resp[u'IndicatorLED']),None)
+            return (self._render(resp[u'IndicatorLED']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_type(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'ChassisType')
         if not 'error' in resp.keys():
-            return (str(resp[u'ChassisType']),None)
+            return (self._render(resp[u'ChassisType']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
-        return str(resp[u'ChassisType'])
+        return self._render(resp[u'ChassisType'])
     
     def get_chassis_reset_options(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Actions')
         if not 'error' in resp.keys():
-            return (str(resp[u'Actions'][u'#Chassis.Reset'][u'ResetType@Redfish.AllowableValues']),None)
+            return (self._render(resp[u'Actions'][u'#Chassis.Reset'][u'ResetType@Redfish.AllowableValues']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     def get_chassis_fans(self):
         fan=[]
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Links')
         for i in resp[u'Links'][u'CooledBy']:
             fan.append(os.path.basename(i[u'@odata.id']).split('||')[1])
         if not 'error' in resp.keys():
-            return (json.dumps(fan),None)
+            return (self._render(fan, json.dumps(fan)),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
     
     def get_chassis_fan_health(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Status')
         if not 'error' in resp.keys():
-            return (str(resp[u'Status'][u'Health']),None)
+            return (self._render(resp[u'Status'][u'Health']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
@@ -303,59 +1813,59 @@ class iDRAC(object):
         pass
     def get_chassis_powered_by(self):
         PSU=[]
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Links')
         for i in resp[u'Links'][u'PoweredBy']:
             PSU.append(os.path.basename(i[u'@odata.id']))
         if not 'error' in resp.keys():
-            return (json.dumps(PSU),None)
+            return (self._render(PSU, json.dumps(PSU)),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_part_number(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'PartNumber')
         if not 'error' in resp.keys():
-            return (str(resp[u'PartNumber']),None)
+            return (self._render(resp[u'PartNumber']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_model(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Model')
         if not 'error' in resp.keys():
-            return (str(resp[u'Model']),None)
+            return (self._render(resp[u'Model']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_manufacturer(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'Manufacturer')
         if not 'error' in resp.keys():
-            return (str(resp[u'Manufacturer']),None)
+            return (self._render(resp[u'Manufacturer']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_power_state(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'PowerState')
         if not 'error' in resp.keys():
-            return (str(resp[u'PowerState']),None)
+            return (self._render(resp[u'PowerState']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_serial_number(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'SerialNumber')
         if not 'error' in resp.keys():
-            return (str(resp[u'SerialNumber']),None)
+            return (self._render(resp[u'SerialNumber']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
     
     def get_chassis_SKU(self):
-        resp = self.send_get_request(self.chassis_uri)
+        resp = self.send_get_request(self.chassis_uri, select=u'SKU')
         if not 'error' in resp.keys():
-            return (str(resp[u'SKU']),None)
+            return (self._render(resp[u'SKU']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
         
@@ -363,7 +1873,7 @@ class iDRAC(object):
     def get_chassis_board_inlet_Temp(self):
         resp = self.send_get_request(self.chassis_uri+u'/Sensors/Temperatures/iDRAC.Embedded.1%23SystemBoardInletTemp')
         if not 'error' in resp.keys():
-            return (str(resp[u'ReadingCelsius']),None)
+            return (self._render(resp[u'ReadingCelsius']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
 
@@ -371,78 +1881,300 @@ class iDRAC(object):
     def get_chassis_board_exhaust_temp(self):
         resp = self.send_get_request(self.chassis_uri+u'/Sensors/Temperatures/iDRAC.Embedded.1%23SystemBoardExhaustTemp')
         if not 'error' in resp.keys():
-            return (str(resp[u'ReadingCelsius']),None)
+            return (self._render(resp[u'ReadingCelsius']),None)
         else:
             return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
 
     def get_chassis_cpu_temp(self):
         resp = self.send_get_request(self.chassis_uri + u'/Sensors/Temperatures/iDRAC.Embedded.1%%23%sTemp' % self.module.params[u'CPU'])
         if not 'error' in resp.keys():
-            return (str(resp[u'ReadingCelsius']),None)
+            return (self._render(resp[u'ReadingCelsius']),None)
         
         return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
     
     def get_chassis_power_consumed_watts(self):
         resp = self.send_get_request(self.chassis_uri+'/Power/PowerControl')
         if not 'error' in resp.keys():
-            return (str(resp[u'PowerConsumedWatts']),None)
+            return (self._render(resp[u'PowerConsumedWatts']),None)
         return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
     
     def get_chassis_fan_rpm(self):
         resp = self.send_get_request(self.chassis_uri + u'/Sensors/Fans/0x17||%s' % self.module.params[u'FAN'])
         if not 'error' in resp.keys():
-            return (str(resp[u'Reading']),None)
+            return (self._render(resp[u'Reading']),None)
         
         return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
     
+    def get_chassis_telemetry(self):
+        # Every temperature, fan and power reading from the Thermal and
+        # Power aggregates: two GETs instead of one per sensor
+        (thermal, power) = self.fetch_resources([self.chassis_uri + u'/Thermal', self.chassis_uri + u'/Power'], cache=False)
+        for resp in (thermal, power):
+            if 'error' in resp:
+                return (None,resp['error']['@Message.ExtendedInfo'][0]['Message'])
+        record = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'temperatures': [],
+            'fans': [],
+            'power_control': [],
+            'power_supplies': [],
+            'voltages': [],
+        }
+        for i in thermal.get(u'Temperatures', []):
+            record['temperatures'].append({
+                'name': i.get(u'Name'),
+                'reading_celsius': i.get(u'ReadingCelsius'),
+                'upper_critical': i.get(u'UpperThresholdCritical'),
+                'health': (i.get(u'Status') or {}).get(u'Health'),
+            })
+        for i in thermal.get(u'Fans', []):
+            record['fans'].append({
+                'name': i.get(u'Name') or i.get(u'FanName'),
+                'reading': i.get(u'Reading'),
+                'units': i.get(u'ReadingUnits'),
+                'health': (i.get(u'Status') or {}).get(u'Health'),
+            })
+        for i in power.get(u'PowerControl', []):
+            metrics = i.get(u'PowerMetrics') or {}
+            record['power_control'].append({
+                'name': i.get(u'Name'),
+                'consumed_watts': i.get(u'PowerConsumedWatts'),
+                'capacity_watts': i.get(u'PowerCapacityWatts'),
+                'average_watts': metrics.get(u'AverageConsumedWatts'),
+                'max_watts': metrics.get(u'MaxConsumedWatts'),
+                'min_watts': metrics.get(u'MinConsumedWatts'),
+            })
+        for i in power.get(u'PowerSupplies', []):
+            record['power_supplies'].append({
+                'name': i.get(u'Name'),
+                'input_watts': i.get(u'PowerInputWatts'),
+                'output_watts': i.get(u'PowerOutputWatts'),
+                'line_input_voltage': i.get(u'LineInputVoltage'),
+                'health': (i.get(u'Status') or {}).get(u'Health'),
+            })
+        for i in power.get(u'Voltages', []):
+            record['voltages'].append({
+                'name': i.get(u'Name'),
+                'reading_volts': i.get(u'ReadingVolts'),
+                'health': (i.get(u'Status') or {}).get(u'Health'),
+            })
+        return (self._render(record, json.dumps(record)),None)
+    
         
     # iDRAC manager API
     def get_manager_health(self):
-        resp = self.send_get_request(self.manager_uri)
-        return str(resp[u'"Status"'][u'Health'])
+        resp = self.send_get_request(self.manager_uri, select=u'Status')
+        return self._render(resp[u'Status'][u'Health'])
     
     def get_manager_reset_options(self):
-        resp = self.send_get_request(self.manager_uri)
-        return str(resp[u'Actions'][u'#Manager.Reset'][u'ResetType@Redfish.AllowableValues'])
+        resp = self.send_get_request(self.manager_uri, select=u'Actions')
+        return self._render(resp[u'Actions'][u'#Manager.Reset'][u'ResetType@Redfish.AllowableValues'])
     
     def get_manager_command_shells(self):
-        resp = self.send_get_request(self.manager_uri)
-        return str(resp[u'CommandShell'][u'ConnectTypesSupported'])
+        resp = self.send_get_request(self.manager_uri, select=u'CommandShell')
+        return self._render(resp[u'CommandShell'][u'ConnectTypesSupported'])
     
     def get_manager_ethernet_interfaces(self):
         eth = []
         resp = self.send_get_request(self.manager_uri + u'/EthernetInterfaces')
         for i in resp[u'Members']:
             eth.append(os.path.basename(i[u'@odata.id']))
-        return ",".join(str(x) for x in eth)
+        return self._render(eth, ",".join(str(x) for x in eth))
     
     def get_manager_firmware(self):
-        resp = self.send_get_request(self.manager_uri)
-        return str(resp[u'FirmwareVersion'])
+        resp = self.send_get_request(self.manager_uri, select=u'FirmwareVersion')
+        return self._render(resp[u'FirmwareVersion'])
     
     def get_manager_graphical_console(self):
-        resp = self.send_get_request(self.manager_uri)
-        return str(resp[u'GraphicalConsole'][u'ConnectTypesSupported'])
+        resp = self.send_get_request(self.manager_uri, select=u'GraphicalConsole')
+        return self._render(resp[u'GraphicalConsole'][u'ConnectTypesSupported'])
+    
+    def iter_log_entries(self, uri):
+        # Entries of a log, one entry in memory at a time. Pages are chained
+        # through Members@odata.nextLink, up to log_top entries in all, and
+        # never go to the response cache.
+        top = self.module.params['log_top']
+        count = 0
+        query = []
+        if self.module.params['log_skip']:
+            query.append(u'$skip=%d' % self.module.params['log_skip'])
+        if top:
+            query.append(u'$top=%d' % top)
+        if query:
+            uri += u'?' + u'&'.join(query)
+        while uri:
+            tail = {}
+            for entry in self.iter_members(uri, tail):
+                yield entry
+                count += 1
+                if top and count >= top:
+                    return
+            next_link = tail.get(u'Members@odata.nextLink')
+            uri = self.base_uri + next_link if next_link else None
+    
+    @staticmethod
+    def _log_entry_key(entry):
+        # (kind, value): log entry Ids are sequence numbers, otherwise the
+        # Created timestamp. Keys of different kinds never compare.
+        entry_id = str(entry.get(u'Id', u''))
+        if entry_id.isdigit():
+            return (u'id', int(entry_id))
+        if entry.get(u'Created') is not None:
+            return (u'created', entry.get(u'Created'))
+        return None
+    
+    def _load_log_cursor(self):
+        # Cursors are saved as [kind, value]; a bare Id or Created from an
+        # older file is read as the pair it stands for
+        try:
+            with open(self.module.params['log_cursor']) as f:
+                cursors = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(cursors, dict):
+            return {}
+        for name, cursor in list(cursors.items()):
+            if isinstance(cursor, list) and len(cursor) == 2:
+                cursors[name] = tuple(cursor)
+            elif isinstance(cursor, int):
+                cursors[name] = (u'id', cursor)
+            elif cursor is not None:
+                cursors[name] = (u'created', cursor)
+        return cursors
+    
+    def _save_log_cursor(self, cursors):
+        path = self.module.params['log_cursor']
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cursors, f)
+        os.rename(tmp, path)
+    
+    def _new_log_entries(self, entries, last):
+        # Skip entries at or before the cursor. On a newest-first log the
+        # first old entry after a newer one means the rest is old as well,
+        # so paging stops there. An entry keyed by another kind than the
+        # cursor can't be placed and is returned.
+        prev = None
+        for entry in entries:
+            key = self._log_entry_key(entry)
+            if key is not None and key[0] == last[0] and key <= last:
+                if prev is not None and prev[0] == key[0] and prev > key:
+                    return
+                prev = key
+                continue
+            prev = key
+            yield entry
+    
+    def read_log(self, name):
+        # Stream the Sel or Lclog log. With log_cursor only entries newer
+        # than the previous run are returned; with log_dest they are
+        # appended to that file as NDJSON instead of being returned. In
+        # check mode neither log_dest nor the cursor is written, so the
+        # next real run still gets the entries.
+        entries = self.iter_log_entries(self.manager_uri + u'/Logs/' + name)
+        cursors = {}
+        if self.module.params['log_cursor']:
+            cursors = self._load_log_cursor()
+            if cursors.get(name) is not None:
+                entries = self._new_log_entries(entries, cursors[name])
+        # Newest key per kind; an Id cursor is preferred over a Created one
+        newest = {}
+        count = 0
+        dest = self.module.params['log_dest']
+        out = open(dest, 'a') if dest and not self.module.check_mode else None
+        collected = []
+        try:
+            for entry in entries:
+                key = self._log_entry_key(entry)
+                if key is not None and (key[0] not in newest or key > newest[key[0]]):
+                    newest[key[0]] = key
+                count += 1
+                if out is not None:
+                    out.write(json.dumps(entry) + '\n')
+                elif not dest:
+                    collected.append(entry)
+        finally:
+            if out is not None:
+                out.close()
+        cursor = newest.get(u'id') or newest.get(u'created') or cursors.get(name)
+        if self.module.params['log_cursor'] and not self.module.check_mode:
+            cursors[name] = cursor
+            self._save_log_cursor(cursors)
+        if dest:
+            summary = {'entries': count, 'dest': dest, 'cursor': cursor}
+            return self._render(summary, json.dumps(summary))
+        return self._render(collected)
     
     def get_manager_sel_log(self):
-        resp = self.send_get_request(self.manager_uri + u'/Logs/Sel')
-        return str(resp[u'Members'])
+        return self.read_log(u'Sel')
         
     
     def get_manager_lc_log(self):
-        resp = self.send_get_request(self.manager_uri + u'/Logs/Lclog')
-        return str(resp[u'Members'])
+        return self.read_log(u'Lclog')
     
     def get_manager_jobs(self):
         jobs = []
         resp = self.send_get_request(self.manager_uri + u'/Jobs')
         for i in resp[u'Members']:
             jobs.append(os.path.basename(i[u'@odata.id']))
-        return ",".join(str(x) for x in jobs)
+        return self._render(jobs, ",".join(str(x) for x in jobs))
 
+    def wait_jobs(self):
+        # Each round reads every job with one $expand GET of the Jobs
+        # collection, or one GET per unfinished job without $expand. The
+        # interval drops back to job_poll_interval when a job changes
+        # state, holds while only PercentComplete moves and doubles while
+        # nothing changes at all.
+        job_ids = [os.path.basename(j.rstrip('/')) for j in (self.module.params['job_ids'] or [])]
+        job_ids += [j for j in self.created_jobs if j not in job_ids]
+        if not job_ids:
+            self.fail("WaitJobs needs job_ids or an earlier command in cmd that starts a job")
+        uri = self.manager_uri + u'/Jobs'
+        start = time.time()
+        deadline = start + self.module.params['job_timeout']
+        interval = self.module.params['job_poll_interval']
+        jobs = {}
+        waited = {}
+        while True:
+            pending = [j for j in job_ids if j not in waited]
+            found = {}
+            if self.supports_expand():
+                resp = self.check_response(uri, self._get(uri + u'?$expand=*($levels=1)', cache=False))
+                found = dict((m.get(u'Id'), m) for m in resp.get(u'Members', []) if m.get(u'Id') in pending)
+            missing = [j for j in pending if j not in found]
+            for (j, job) in zip(missing, self.fetch_resources([uri + u'/' + j for j in missing], cache=False)):
+                found[j] = {u'JobState': u'NotFound', u'Message': u'No such job'} if 'error' in job else job
+            now = time.time()
+            changed = progress = False
+            for j in pending:
+                state = dict((k, found[j].get(k)) for k in (u'JobState', u'PercentComplete', u'Message'))
+                changed = changed or state[u'JobState'] != jobs.get(j, {}).get(u'JobState')
+                progress = progress or state != jobs.get(j)
+                jobs[j] = state
+                if state[u'JobState'] in JOB_FINAL_STATES + (u'NotFound',):
+                    waited[j] = now - start
+            if len(waited) == len(job_ids) or now >= deadline:
+                break
+            if changed:
+                interval = self.module.params['job_poll_interval']
+            elif not progress:
+                interval = min(interval * 2, self.module.params['job_poll_max'])
+            time.sleep(min(interval, deadline - now))
+        out = {}
+        errors = []
+        for j in job_ids:
+            out[j] = dict(jobs[j], Duration=round(waited.get(j, time.time() - start), 1))
+            state = jobs[j][u'JobState']
+            if j not in waited:
+                errors.append("%s still %s at %s%% after %ss" % (j, state, jobs[j][u'PercentComplete'],
+                                                                self.module.params['job_timeout']))
+            elif state != u'Completed':
+                errors.append("%s %s: %s" % (j, state, jobs[j][u'Message']))
+        return (self._render(out, json.dumps(out, sort_keys=True)), "; ".join(errors))
+    
     def get_manager_host_name(self):
         resp = self.send_get_request(self.manager_uri + u'/NetworkProtocol')
-        return str(resp[u'HostName'])
+        return self._render(resp[u'HostName'])
     
     def manager_reset(self):
         payload = {u'ResetType': u"%s"%(self.module.params[u'ResetType'])}
@@ -451,270 +2183,820 @@ class iDRAC(object):
          
     
     def get_event_type_for_subscription(self):
-        resp = self.send_get_request(self.eventsvc_uri)
-        return str(resp[u'EventTypesForSubscription'])
+        resp = self.send_get_request(self.eventsvc_uri, select=u'EventTypesForSubscription')
+        return self._render(resp[u'EventTypesForSubscription'])
     
     def get_event_service_health(self):
-        resp = self.send_get_request(self.eventsvc_uri)
-        return str(resp[u'Status'][u'Health'])
+        resp = self.send_get_request(self.eventsvc_uri, select=u'Status')
+        return self._render(resp[u'Status'][u'Health'])
     
     def get_event_state(self):
-        resp = self.send_get_request(self.eventsvc_uri)
-        return str(resp[u'Status'][u'State'])
+        resp = self.send_get_request(self.eventsvc_uri, select=u'Status')
+        return self._render(resp[u'Status'][u'State'])
+    
+    def get_event_sse_uri(self):
+        # ServerSentEventUri is only present on firmware that streams events
+        resp = self._get(self.eventsvc_uri, cache=False)
+        sse_uri = resp.get(u'ServerSentEventUri')
+        if sse_uri and sse_uri.startswith('/'):
+            sse_uri = self.base_uri + sse_uri
+        return sse_uri
+    
+    def iter_sse_events(self, uri, state=None):
+        # Decode a text/event-stream: "data:" lines up to a blank line make
+        # one event. Blocks until the iDRAC sends something and ends when
+        # the iDRAC closes the stream. state['last_event_id'] is sent as
+        # Last-Event-ID, so a new stream carries on after the events seen,
+        # and is updated with the "id:" of every event.
+        state = {} if state is None else state
+        headers = {'Accept': 'text/event-stream'}
+        if state.get('last_event_id'):
+            headers['Last-Event-ID'] = state['last_event_id']
+        response = self.send_request('GET', uri, stream=True, headers=headers,
+                                     timeout=(self.timeout[0], None))
+        if response.status_code != 200:
+            response.close()
+            self.fail("Event stream failed. Error code:%s" % response.status_code)
+        data = []
+        event_id = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    if line.startswith('data:'):
+                        data.append(line[5:].lstrip())
+                    elif line.startswith('id:'):
+                        event_id = line[3:].strip()
+                    continue
+                if event_id is not None:
+                    state['last_event_id'] = event_id
+                    event_id = None
+                if data:
+                    payload = '\n'.join(data)
+                    data = []
+                    try:
+                        yield json.loads(payload)
+                    except ValueError:
+                        yield {'Message': payload}
+        finally:
+            response.close()
+    
+    def create_event_subscription(self, destination, event_types=None, context=None):
+        payload = {'Destination': destination, 'Protocol': 'Redfish'}
+        if event_types:
+            payload['EventTypes'] = event_types
+        if context:
+            payload['Context'] = context
+        headers = {'content-type': 'application/json'}
+        response = self.send_request('POST', self.eventsvc_uri + u'/Subscriptions', data=json.dumps(payload), headers=headers)
+        if response.status_code not in (200, 201):
+            self.fail("Event subscription failed. Error code:%s" % response.status_code)
+        location = response.headers.get('Location', '')
+        if location.startswith('/'):
+            location = self.base_uri + location
+        return location
+    
+    def delete_event_subscription(self, uri):
+        return str(self.send_request('DELETE', uri).status_code)
     
     def get_session_id(self):
         mem = []
         resp = self.send_get_request(self.session_uri)
         for i in resp[u'Members']:
             mem.append(os.path.basename(i[u'@odata.id']))
-        return ",".join(str(x) for x in mem)
+        return self._render(mem, ",".join(str(x) for x in mem))
     
     def get_firmware_inventory(self):
         fw = dict()
-        resp = self.send_get_request(self.updatesvc_uri + u'/FirmwareInventory')
-        for i in resp[u'Members']:
-            fw_info = self.send_get_request(self.updatesvc_uri + u'/FirmwareInventory/' + '%s' % os.path.basename(i[u'@odata.id']))
+        for fw_info in self.iter_collection(self.updatesvc_uri + u'/FirmwareInventory'):
             fw[fw_info[u'Name']] = fw_info[u'Version']
-        return json.dumps(fw)
+        return self._render(fw, json.dumps(fw))
+    
+    def get_dell_system_id(self):
+        # The model's Dell SystemID as a catalog names it, e.g. "0716";
+        # the iDRAC reports it as a number
+        system = self.check_response(self.system_uri, self.send_get_request(self.system_uri, select='Oem'))
+        dell = (system.get(u'Oem') or {}).get(u'Dell') or {}
+        system_id = (dell.get(u'DellSystem') or {}).get(u'SystemID')
+        if isinstance(system_id, int):
+            return '%04X' % system_id
+        return str(system_id).upper() if system_id else None
+    
+    def get_firmware_compliance(self):
+        try:
+            baseline = load_baseline(self.module.params['baseline'], self.module.params['cache_dir'])
+        except (IOError, OSError, ValueError, SyntaxError) as e:
+            self.fail("Cannot read baseline %s: %s" % (self.module.params['baseline'], e))
+        # A catalog lists the versions of every PowerEdge model; only the
+        # entries for this one apply
+        models = [m for m in baseline if m]
+        baseline = _baseline_for(baseline, self.get_dell_system_id() if models else None)
+        uri = self.updatesvc_uri + u'/FirmwareInventory'
+        if self.supports_expand():
+            members = self.iter_collection(uri)
+        else:
+            # Dell inventory Ids carry the component id (the SoftwareId) and
+            # the version, so only members that are out of compliance need
+            # a GET of their own; Ids of any other form are always fetched.
+            # Baseline entries are keyed by SoftwareId or by inventory Id.
+            resp = self.check_response(uri, self.send_get_request(uri))
+            fetch = []
+            for i in resp[u'Members']:
+                member_id = os.path.basename(i[u'@odata.id'])
+                (state, component, version) = _firmware_id(member_id)
+                if state is not None:
+                    key = component if component in baseline else member_id
+                    if state != u'Installed' or key not in baseline or version == baseline[key]['Version']:
+                        continue
+                fetch.append(self.base_uri + i[u'@odata.id'])
+            members = [self.check_response(uri, m) for m in self.fetch_resources(fetch)]
+        out = {}
+        for member in members:
+            (state, component, version) = _firmware_id(member.get(u'Id', u''))
+            if state not in (None, u'Installed'):
+                continue
+            for key in (member.get(u'SoftwareId'), component, member.get(u'Id')):
+                if key and key in baseline:
+                    wanted = baseline[key]['Version']
+                    installed = member.get(u'Version')
+                    if installed != wanted:
+                        older = _version_key(installed or '') < _version_key(wanted)
+                        if key == member.get(u'Id'):
+                            key = member.get(u'SoftwareId') or component
+                        out[member[u'Id']] = {'Name': member.get(u'Name'),
+                                              'SoftwareId': key,
+                                              'Installed': installed,
+                                              'Baseline': wanted,
+                                              'Status': 'Older' if older else 'Newer'}
+                    break
+        return self._render(out, json.dumps(out, sort_keys=True))
         
 
     
+def _firmware_id(inventory_id):
+    # "Installed-25227-4.40.00.00__iDRAC.Embedded.1-1" ->
+    # ("Installed", "25227", "4.40.00.00"); (None, None, None) for Ids
+    # that don't follow the Dell pattern
+    parts = inventory_id.split(u'__', 1)[0].split(u'-', 2)
+    if len(parts) == 3 and parts[0] in (u'Installed', u'Previous', u'Available'):
+        return tuple(parts)
+    return (None, None, None)
+
+def _version_key(version):
+    # Orders "2.10.5" after "2.9.0" and Dell "A10" after "A9"
+    return tuple((0, int(t), '') if t.isdigit() else (1, 0, t.lower())
+                 for t in re.findall(r'\d+|[A-Za-z]+', version))
+
+def _read_catalog(path):
+    # Dell Catalog.xml: each SoftwareComponent names the componentIDs of
+    # the devices it updates and the systemIDs of the models it is for;
+    # the BIOS, for one, has the same componentID on every model. The
+    # index is keyed by systemID, '' for components of no particular
+    # model, and the newest version per componentID wins within a model.
+    # iterparse keeps memory flat on catalogs of tens of megabytes.
+    index = {}
+    from xml.etree import ElementTree
+    for _, elem in ElementTree.iterparse(path):
+        if elem.tag.rsplit('}', 1)[-1] != 'SoftwareComponent':
+            continue
+        version = elem.get('vendorVersion') or elem.get('dellVersion')
+        display = elem.find('Name/Display')
+        name = display.text.strip() if display is not None and display.text else None
+        models = [m.get('systemID').upper() for m in elem.iter('Model') if m.get('systemID')] or ['']
+        for device in elem.iter('Device'):
+            component = device.get('componentID')
+            if not (component and version):
+                continue
+            for model in models:
+                known = index.setdefault(model, {}).get(component)
+                if known is None or _version_key(version) > _version_key(known['Version']):
+                    index[model][component] = {'Version': version, 'Name': name}
+        elem.clear()
+    return index
+
+def _baseline_for(index, system_id):
+    # The baseline of one model: the entries for no particular model,
+    # overridden by those for system_id
+    baseline = dict(index.get('', {}))
+    if system_id:
+        baseline.update(index.get(system_id, {}))
+    return baseline
+
+def _read_json_baseline(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [dict(v, SoftwareId=k) if isinstance(v, dict) else {'SoftwareId': k, 'Version': v}
+                for k, v in data.items()]
+    index = {}
+    for item in data:
+        key = item.get('SoftwareId') or item.get('Id')
+        if not key or not item.get('Version'):
+            raise ValueError("baseline entry without SoftwareId/Id and Version: %s" % json.dumps(item))
+        index[str(key)] = {'Version': str(item['Version']), 'Name': item.get('Name')}
+    return {'': index}
+
+# Parsed baselines by path, size and mtime, shared by every client of the
+# process so that a fleet run parses the catalog once. Each maps a Dell
+# systemID ('' for any model) to the entries by SoftwareId or Id.
+_baselines = {}
+_baselines_lock = threading.Lock()
+
+def load_baseline(path, cache_dir=None):
+    path = os.path.abspath(os.path.expanduser(path))
+    st = os.stat(path)
+    key = '%s:%d:%d' % (path, st.st_size, int(st.st_mtime))
+    with _baselines_lock:
+        if key in _baselines:
+            return _baselines[key]
+        index_path = None
+        if cache_dir:
+            cache_dir = os.path.expanduser(cache_dir)
+            index_path = os.path.join(cache_dir, 'baseline-v2-%s.json' % hashlib.sha1(key.encode('utf-8')).hexdigest())
+            try:
+                with open(index_path) as f:
+                    _baselines[key] = json.load(f)
+                return _baselines[key]
+            except (IOError, OSError, ValueError):
+                pass
+        with open(path, 'rb') as f:
+            head = f.read(64).lstrip(codecs.BOM_UTF8).lstrip()
+        if head.startswith(b'<') or head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            index = _read_catalog(path)
+        else:
+            index = _read_json_baseline(path)
+        if index_path:
+            try:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir, 0o700)
+                fd, tmp = tempfile.mkstemp(dir=cache_dir)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(index, f)
+                os.rename(tmp, index_path)
+            except (IOError, OSError):
+                pass
+        _baselines[key] = index
+        return index
+
+# Command registry: (subsystem, cmd) -> Command.
+#   resource  attribute of iDRAC holding the URI the command reads, or None
+#             when it reads sub resources the fetch planner doesn't manage
+#   fields    top-level properties of that resource the command needs
+#   getter    iDRAC method producing the output, or None to read `path`;
+#             it returns out, (out, err) or (out, err, changed)
+#   path      property path extracted from the resource when there's no getter
+#   requires  module params that must be set
+#   action    (expected status code, failure message) for state changing calls
+Command = namedtuple('Command', 'resource fields getter path requires action')
+
+# Configure targets relative to a member URI: (attribute, path, whether the
+# desired state names entries of the resource's Attributes)
+CONFIG_TARGETS = {'System': ('system_uri', '', False),
+                  'Bios': ('system_uri', '/Bios', True),
+                  'Chassis': ('chassis_uri', '', False),
+                  'Manager': ('manager_uri', '', False),
+                  'iDRAC': ('manager_uri', '/Attributes', True)}
+
+def _config_equal(have, want):
+    # Attribute values come back typed while playbooks often quote them
+    if have == want:
+        return True
+    scalar = lambda v: v is not None and not isinstance(v, (bool, dict, list))
+    return scalar(have) and scalar(want) and str(have) == str(want)
+
+def _config_diff(current, desired):
+    # The part of desired that current doesn't have yet; objects are
+    # compared property by property, anything else as a whole
+    diff = {}
+    for (key, want) in desired.items():
+        have = current.get(key) if isinstance(current, dict) else None
+        if isinstance(want, dict) and isinstance(have, dict):
+            sub = _config_diff(have, want)
+            if sub:
+                diff[key] = sub
+        elif not _config_equal(have, want):
+            diff[key] = want
+    return diff
+
+def _config_changes(current, diff, prefix=''):
+    # diff flattened to dotted property paths with the current values
+    changes = {}
+    for (key, want) in diff.items():
+        have = current.get(key) if isinstance(current, dict) else None
+        if isinstance(want, dict) and isinstance(have, dict):
+            changes.update(_config_changes(have, want, prefix + key + '.'))
+        else:
+            changes[prefix + key] = {'before': have, 'after': want}
+    return changes
+
+def _config_has(diff, path):
+    # Whether diff still holds the dotted path of a _config_changes entry
+    for key in path.split('.'):
+        if not isinstance(diff, dict) or key not in diff:
+            return False
+        diff = diff[key]
+    return True
+
+def _strip_odata(value):
+    if isinstance(value, dict):
+        return dict((k, _strip_odata(v)) for (k, v) in value.items() if not k.startswith(u'@odata.'))
+    if isinstance(value, list):
+        return [_strip_odata(v) for v in value]
+    return value
+
+def _compress(value):
+    # JSON, gzip, base64: for the controller to decode again with
+    # json.loads(gzip.decompress(base64.b64decode(s)))
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as f:
+        f.write(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+    return base64.b64encode(buf.getvalue()).decode('ascii')
+
+_json_decoder = json.JSONDecoder()
+# Characters that may continue a number: a value decoded up to one of them
+# can be a number cut short by the end of a chunk, like 276. of 276.5
+_NUMBER_TAIL = frozenset(u'0123456789.eE+-')
+
+class _JSONChunks(object):
+    # Text buffer over an iterable of UTF-8 byte chunks, read on demand by
+    # _iter_json_members(); the part already parsed is dropped as more
+    # arrives
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buf = u''
+        self.pos = 0
+
+    def more(self):
+        # Append the next chunk; False at the end of the input
+        while self._chunks is not None:
+            try:
+                text = self._decode(next(self._chunks))
+            except StopIteration:
+                self._chunks = None
+                text = self._decode(b'', True)
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        # The next character that isn't whitespace, None at the end
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in u' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError("Expected one of %r, found %r" % (chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        # The next JSON value. One cut off by the end of the buffer fails to
+        # decode, and a number at or near the end (stopped by a "." or "e"
+        # its digits follow) may go on in the next chunk, so either way more
+        # is read first: at least as much again as is buffered, so that a
+        # large value is decoded a few times at most.
+        self.peek()
+        while True:
+            try:
+                (value, end) = _json_decoder.raw_decode(self.buf, self.pos)
+                if self._chunks is None or (end < len(self.buf) and self.buf[end] not in _NUMBER_TAIL):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self._chunks is None:
+                    raise
+            want = 2 * (len(self.buf) - self.pos)
+            while len(self.buf) - self.pos < want and self.more():
+                pass
+
+def _iter_json_members(chunks, key=u'Members', tail=None):
+    # Items of the `key` array of the JSON object in chunks, each yielded
+    # as soon as it has been read, so that a body of any size costs one
+    # item and a chunk of memory. The object's other properties are put
+    # in tail. ValueError when the body isn't such an object.
+    stream = _JSONChunks(chunks)
+    stream.expect(u'{')
+    if stream.peek() == u'}':
+        return
+    while True:
+        name = stream.value()
+        stream.expect(u':')
+        if name == key and stream.peek() == u'[':
+            stream.expect(u'[')
+            if stream.peek() == u']':
+                stream.expect(u']')
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.expect(u',]') == u']':
+                        break
+        else:
+            value = stream.value()
+            if tail is not None:
+                tail[name] = value
+        if stream.expect(u',}') == u'}':
+            return
+
+# Resource attribute -> (collection, module param naming the member)
+MEMBER_COLLECTIONS = {'system_uri': ('Systems', 'system_id'),
+                      'chassis_uri': ('Chassis', 'chassis_id'),
+                      'manager_uri': ('Managers', 'manager_id')}
+SUBSYSTEM_MEMBERS = {'System': 'system_uri', 'Chassis': 'chassis_uri', 'Manager': 'manager_uri'}
+
+# Discovered member URIs by (iDRAC, collection), shared by every client of
+# the process
+_members = {}
+_members_lock = threading.Lock()
+
+# JobState values after which an iDRAC job no longer changes
+JOB_FINAL_STATES = (u'Completed', u'CompletedWithErrors', u'Failed', u'RebootFailed',
+                    u'Cancelled', u'Exception', u'Killed')
+
+def _getter(getter, resource=None, fields=(), requires=()):
+    return Command(resource, frozenset(fields), getter, None, tuple(requires), None)
+
+def _field(resource, *path):
+    return Command(resource, frozenset(path[:1]), None, path, (), None)
+
+def _action(getter, requires, expected, failure):
+    return Command(None, frozenset(), getter, None, tuple(requires), (expected, failure))
+
+COMMANDS = {
+    ('System', 'Health'): _getter('get_system_health', 'system_uri', ['Status']),
+    ('System', 'SerialNumber'): _getter('get_system_serial_number', 'system_uri', ['SerialNumber']),
+    ('System', 'ServiceTag'): _getter('get_system_service_tag', 'system_uri', ['SKU']),
+    ('System', 'AssetTag'): _field('system_uri', 'AssetTag'),
+    ('System', 'Manufacturer'): _getter('get_system_Manufacturer', 'system_uri', ['Manufacturer']),
+    ('System', 'Model'): _field('system_uri', 'Model'),
+    ('System', 'UUID'): _field('system_uri', 'UUID'),
+    ('System', 'HostName'): _field('system_uri', 'HostName'),
+    ('System', 'IndicatorLED'): _field('system_uri', 'IndicatorLED'),
+    ('System', 'BiosVersion'): _getter('get_system_bios_version', 'system_uri', ['BiosVersion']),
+    ('System', 'SystemType'): _getter('get_system_type', 'system_uri', ['SystemType']),
+    ('System', 'PowerState'): _getter('get_system_power_state', 'system_uri', ['PowerState']),
+    ('System', 'MemoryHealth'): _getter('get_system_memory_health', 'system_uri', ['MemorySummary']),
+    ('System', 'TotalSystemMemoryGiB'): _getter('get_system_memory_in_GB', 'system_uri', ['MemorySummary']),
+    ('System', 'ProcessorCount'): _getter('get_processor_count', 'system_uri', ['ProcessorSummary']),
+    ('System', 'ProcessorHealth'): _getter('get_processor_health', 'system_uri', ['ProcessorSummary']),
+    ('System', 'ProcessorModel'): _getter('get_processor_model', 'system_uri', ['ProcessorSummary']),
+    ('System', 'BootSources'): _getter('get_boot_sources'),
+    ('System', 'EthernetInterfaces'): _getter('get_system_ethernet_interfaces'),
+    ('System', 'PermanentMACAddress'): _getter('get_system_ethernet_permanent_MAC_address', requires=['eth_interface']),
+    ('System', 'SecureBoot'): _getter('get_system_secure_boot_status'),
+    ('System', 'SecureBootCerts'): _getter('get_system_secure_boot_certificates'),
+    ('System', 'StorageControllers'): _getter('get_system_storage_controllers'),
+    ('System', 'StorageControllerDisks'): _getter('get_system_storage_controller_disks', requires=['storage_controller']),
+    ('System', 'CPUs'): _getter('get_system_cpus'),
+    ('System', 'StorageTopology'): _getter('get_storage_topology'),
+    ('System', 'Reset'): _action('system_reset', ['ResetType'], '204', "system reset failed"),
+    ('System', 'OneTimeBoot'): _getter('system_onetime', requires=['Target']),
+    ('System', 'Configure'): _getter('configure', requires=['attributes']),
+    ('System', 'WaitJobs'): _getter('wait_jobs'),
+
+    ('Manager', 'Health'): _getter('get_manager_health', 'manager_uri', ['Status']),
+    ('Manager', 'ResetOptions'): _getter('get_manager_reset_options', 'manager_uri', ['Actions']),
+    ('Manager', 'CommandShells'): _getter('get_manager_command_shells', 'manager_uri', ['CommandShell']),
+    ('Manager', 'EthernetInterfaces'): _getter('get_manager_ethernet_interfaces'),
+    ('Manager', 'FirmwareVersion'): _getter('get_manager_firmware', 'manager_uri', ['FirmwareVersion']),
+    ('Manager', 'GraphicalConsole'): _getter('get_manager_graphical_console', 'manager_uri', ['GraphicalConsole']),
+    ('Manager', 'Model'): _field('manager_uri', 'Model'),
+    ('Manager', 'UUID'): _field('manager_uri', 'UUID'),
+    ('Manager', 'DateTime'): _field('manager_uri', 'DateTime'),
+    ('Manager', 'SELLogs'): _getter('get_manager_sel_log'),
+    ('Manager', 'LCLogs'): _getter('get_manager_lc_log'),
+    ('Manager', 'Jobs'): _getter('get_manager_jobs'),
+    ('Manager', 'WaitJobs'): _getter('wait_jobs'),
+    ('Manager', 'Reset'): _action('manager_reset', ['ResetType'], '204', "Manager reset failed"),
+    ('Manager', 'Configure'): _getter('configure', requires=['attributes']),
+
+    ('Chassis', 'IndicatorLED'): _getter('get_chassis_indicator_LED_status', 'chassis_uri', ['IndicatorLED']),
+    ('Chassis', 'ChassisType'): _getter('get_chassis_type', 'chassis_uri', ['ChassisType']),
+    ('Chassis', 'ResetTypes'): _getter('get_chassis_reset_options', 'chassis_uri', ['Actions']),
+    ('Chassis', 'CooledBy'): _getter('get_chassis_fans', 'chassis_uri', ['Links']),
+    ('Chassis', 'Health'): _getter('get_chassis_health', 'chassis_uri', ['Status']),
+    ('Chassis', 'PoweredBy'): _getter('get_chassis_powered_by', 'chassis_uri', ['Links']),
+    ('Chassis', 'PartNumber'): _getter('get_chassis_part_number', 'chassis_uri', ['PartNumber']),
+    ('Chassis', 'Model'): _getter('get_chassis_model', 'chassis_uri', ['Model']),
+    ('Chassis', 'Manufacturer'): _getter('get_chassis_manufacturer', 'chassis_uri', ['Manufacturer']),
+    ('Chassis', 'PowerState'): _getter('get_chassis_power_state', 'chassis_uri', ['PowerState']),
+    ('Chassis', 'SerialNumber'): _getter('get_chassis_serial_number', 'chassis_uri', ['SerialNumber']),
+    ('Chassis', 'SKU'): _getter('get_chassis_SKU', 'chassis_uri', ['SKU']),
+    ('Chassis', 'AssetTag'): _field('chassis_uri', 'AssetTag'),
+    ('Chassis', 'BoardInletTemp'): _getter('get_chassis_board_inlet_Temp'),
+    ('Chassis', 'BoardExhaustTemp'): _getter('get_chassis_board_exhaust_temp'),
+    ('Chassis', 'CPUTemp'): _getter('get_chassis_cpu_temp', requires=['CPU']),
+    ('Chassis', 'PowerConsumedWatts'): _getter('get_chassis_power_consumed_watts'),
+    ('Chassis', 'FANRPM'): _getter('get_chassis_fan_rpm', requires=['FAN']),
+    ('Chassis', 'Telemetry'): _getter('get_chassis_telemetry'),
+    ('Chassis', 'Configure'): _getter('configure', requires=['attributes']),
+
+    ('Event', 'types'): _getter('get_event_type_for_subscription', 'eventsvc_uri', ['EventTypesForSubscription']),
+    ('Event', 'health'): _getter('get_event_service_health', 'eventsvc_uri', ['Status']),
+    ('Event', 'state'): _getter('get_event_state', 'eventsvc_uri', ['Status']),
+
+    ('Session', 'id'): _getter('get_session_id'),
+
+    ('FW', 'FirmwareInventory'): _getter('get_firmware_inventory'),
+    ('FW', 'Compliance'): _getter('get_firmware_compliance', requires=('baseline',)),
+}
+
+def subsystem_commands(subsystem):
+    return sorted(cmd for (sub, cmd) in COMMANDS if sub == subsystem)
+
+def validate_commands(module, subsystem, cmds):
+    # Reject unknown commands and missing parameters before any request
+    for cmd in cmds:
+        command = COMMANDS.get((subsystem, cmd))
+        if command is None:
+            module.fail_json(msg="Unknown %s command %s, expected one of: %s" % (subsystem, cmd, ", ".join(subsystem_commands(subsystem))))
+        for param in command.requires:
+            if module.params[param] is None:
+                module.fail_json(msg="Please provide %s for %s command %s" % (param, subsystem, cmd))
+
+def plan_fetch(subsystem, cmds):
+    # The resources a batch reads and, for each, every property it needs:
+    # one GET per resource covers the whole batch
+    plan = {}
+    for cmd in cmds:
+        command = COMMANDS[(subsystem, cmd)]
+        if command.resource:
+            plan.setdefault(command.resource, set()).update(command.fields)
+    return plan
+
+def run_command(module, idrac, cmd):
+    command = COMMANDS[(module.params['subsystem'], cmd)]
+    rc = None
+    out = None if module.params['output'] == 'structured' else ''
+    err = ''
+
+    if command.getter is None:
+        resp = idrac.send_get_request(getattr(idrac, command.resource), select=command.path[0])
+        if 'error' in resp:
+            err = resp['error']['@Message.ExtendedInfo'][0]['Message']
+        else:
+            value = resp
+            for key in command.path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                out = idrac._render(value)
+    elif command.action:
+        (expected, failure) = command.action
+        resp = getattr(idrac, command.getter)()
+        if resp == expected:
+            rc = resp
+            out = 'OK'
+        else:
+            err = "%s. Error code:%s" % (failure, resp)
+    else:
+        value = getattr(idrac, command.getter)()
+        if isinstance(value, tuple) and len(value) == 3:
+            (out, err, changed) = value
+            if changed:
+                rc = 'changed'
+        elif isinstance(value, tuple):
+            (out, err) = value
+        else:
+            out = value
+
+    return (rc, out, err)
+
+def _host_key(host):
+    # File name for per-host state such as the cache and the snapshot
+    return host.replace(':', '_').replace('/', '_')
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _snapshot_delta(old, outs, errs, nested):
+    # Compare outs with the hashes of the previous run; returns the new
+    # hashes and the entries that differ. Failed commands keep their hash.
+    hashes = dict(old)
+    delta = {}
+    for (key, value) in outs.items():
+        if nested:
+            (hashes[key], changes) = _snapshot_delta(old.get(key) or {}, value, errs.get(key) or {}, False)
+            if changes:
+                delta[key] = changes
+        elif key not in errs:
+            digest = _digest(value)
+            if old.get(key) != digest:
+                hashes[key] = digest
+                delta[key] = value
+    return (hashes, delta)
+
+def report_changes(module, outs, errs):
+    # snapshot_dir: keep the results that changed since the previous run
+    # of this subsystem against this host
+    path = os.path.join(os.path.expanduser(module.params['snapshot_dir']),
+                        _host_key(module.params['idracip']) + '.json')
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (IOError, OSError, ValueError):
+        snapshot = {}
+    subsystem = module.params['subsystem']
+    nested = module.params['all_members'] and subsystem in SUBSYSTEM_MEMBERS
+    (snapshot[subsystem], delta) = _snapshot_delta(snapshot.get(subsystem) or {}, outs, errs, nested)
+    if delta and not module.check_mode:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        # Write then rename so concurrent tasks never read half a file
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f, sort_keys=True)
+        os.rename(tmp, path)
+    return (bool(delta), delta)
+
+def run_commands(module, idrac, cmds):
+    # Run a batch of commands of module.params['subsystem'] against one
+    # iDRAC, or against each member with all_members; outs and errs are
+    # then keyed by member id first
+    if module.params['all_members'] and module.params['subsystem'] in SUBSYSTEM_MEMBERS:
+        return run_member_commands(module, idrac, cmds)
+    return run_batch(module, idrac, cmds)
+
+def run_member_commands(module, idrac, cmds):
+    attr = SUBSYSTEM_MEMBERS[module.params['subsystem']]
+    validate_commands(module, module.params['subsystem'], cmds)
+    members = idrac.members(MEMBER_COLLECTIONS[attr][0])
+    if module.params['auth_mode'] == 'session':
+        # One Redfish session for all members rather than one each
+        idrac.session_token()
+    # Shallow copies share the connection pool, the session, the memo and
+    # the timings; only the member URI differs
+    clients = []
+    for uri in members:
+        client = copy.copy(idrac)
+        setattr(client, attr, uri)
+        client._member_defaults = set()
+        clients.append(client)
+    try:
+        results = _run_parallel(lambda client: run_batch(module, client, cmds), clients,
+                                max(1, min(module.params['max_concurrency'], len(clients))))
+    except iDRACError as e:
+        idrac.fail(str(e))
+    idrac.request_count += sum(client.request_count - idrac.request_count for client in clients)
+    changed = False
+    outs = {}
+    errs = {}
+    for (uri, (member_changed, out, err)) in zip(members, results):
+        member = os.path.basename(uri)
+        changed = changed or member_changed
+        if out:
+            outs[member] = out
+        if err:
+            errs[member] = err
+    return (changed, outs, errs)
+
+def run_batch(module, idrac, cmds):
+    # Structured output keeps every command in outs, None when it failed
+    structured = module.params['output'] == 'structured'
+    outs = {}
+    errs = {}
+    changed = False
+    validate_commands(module, module.params['subsystem'], cmds)
+    idrac.prefetch(plan_fetch(module.params['subsystem'], cmds))
+    for cmd in cmds:
+        (rc, out, err) = run_command(module, idrac, cmd)
+        if rc is not None:
+            changed = True
+        if out or structured:
+            outs[cmd] = out
+        if err:
+            errs[cmd] = err
+    return (changed, outs, errs)
+
+def idrac_argument_spec():
+    return dict(
+        subsystem = dict(required=True, type='str', default=None, choices=['System', 'Manager', 'Session', 'Event', 'Chassis', 'FW']),
+        idracip = dict(required=True, type='str', default=None),
+        idracuser = dict(required=False, type='str', default='root'),
+        idracpswd = dict(required=False, type='str', default='calvin'),
+        cmd = dict(required=False, type='list', default=None),
+        eth_interface = dict(required=False, type='str', default=None),
+        storage_controller = dict(required=False, type='str', default=None),
+        ResetType = dict(required=False, type='str', default=None,choices=["On", "ForceOff", "GracefulRestart", "GracefulShutdown", "PushPowerButton", "Nmi"]),
+        Target = dict(required=False, type='str', default=None, choices=["None","Pxe","Floppy","Cd","Hdd","BiosSetup","Utilities","UefiTarget","SDCard","UefiHttp"]),
+        FAN = dict(required=False, type='str', default=None),
+        CPU = dict(required=False, type='str', default=None),
+        auth_mode = dict(required=False, type='str', default='basic', choices=['basic', 'session']),
+        pool_maxsize = dict(required=False, type='int', default=4),
+        max_concurrency = dict(required=False, type='int', default=4),
+        odata_query = dict(required=False, type='bool', default=True),
+        cache_dir = dict(required=False, type='path', default=None),
+        cache_ttl = dict(required=False, type='int', default=300),
+        cache_resource_ttl = dict(required=False, type='dict', default=None),
+        log_dest = dict(required=False, type='path', default=None),
+        log_cursor = dict(required=False, type='path', default=None),
+        log_skip = dict(required=False, type='int', default=None),
+        log_top = dict(required=False, type='int', default=None),
+        timings = dict(required=False, type='bool', default=False),
+        trace_file = dict(required=False, type='path', default=None),
+        connect_timeout = dict(required=False, type='float', default=10),
+        read_timeout = dict(required=False, type='float', default=60),
+        retries = dict(required=False, type='int', default=3),
+        retry_backoff = dict(required=False, type='float', default=0.5),
+        retry_backoff_max = dict(required=False, type='float', default=30),
+        baseline = dict(required=False, type='path', default=None),
+        job_ids = dict(required=False, type='list', default=None),
+        job_timeout = dict(required=False, type='int', default=3600),
+        job_poll_interval = dict(required=False, type='float', default=2),
+        job_poll_max = dict(required=False, type='float', default=30),
+        system_id = dict(required=False, type='str', default=None),
+        chassis_id = dict(required=False, type='str', default=None),
+        manager_id = dict(required=False, type='str', default=None),
+        all_members = dict(required=False, type='bool', default=False),
+        output = dict(required=False, type='str', default='text', choices=['text', 'structured']),
+        compress_threshold = dict(required=False, type='int', default=None),
+        attributes = dict(required=False, type='dict', default=None),
+        snapshot_dir = dict(required=False, type='path', default=None),
+        transport = dict(required=False, type='str', default='requests', choices=['requests', 'http.client']),
+        pin_dir = dict(required=False, type='path', default=None),
+    )
+
+class iDRACError(Exception):
+    pass
+
+class StandaloneModule(object):
+    # Stand-in for AnsibleModule so the iDRAC class can be driven from
+    # plain Python (fleet tools) with the module's defaults
+    check_mode = False
+
+    def __init__(self, **params):
+        self.params = dict((k, v.get('default')) for k, v in idrac_argument_spec().items())
+        self.params.update(params)
+
+    def fail_json(self, **kwargs):
+        raise iDRACError(kwargs.get('msg'))
+
 def main():
+    from ansible.module_utils.basic import AnsibleModule
     # Parsing argument file
     module = AnsibleModule(
-            argument_spec = dict(
-                subsystem = dict(required=True, type='str', default=None, choices=['System', 'Manager', 'Session', 'Event', 'Chassis', 'FW']),
-                idracip = dict(required=True, type='str', default=None),
-                idracuser = dict(required=False, type='str', default='root'),
-                idracpswd = dict(required=False, type='str', default='calvin'),
-                cmd = dict(required=False, type='str', default=None),
-                eth_interface = dict(required=False, type='str', default=None),
-                storage_controller = dict(required=False, type='str', default=None),
-                ResetType = dict(required=False, type='str', default=None,choices=["On", "ForceOff", "GracefulRestart", "GracefulShutdown", "PushPowerButton", "Nmi"]),
-                Target = dict(required=False, type='str', default=None, choices=["None","Pxe","Floppy","Cd","Hdd","BiosSetup","Utilities","UefiTarget","SDCard","UefiHttp"]),
-                FAN = dict(required=False, type='str', default=None),
-                CPU = dict(required=False, type='str', default=None),
-            ),
+            argument_spec = idrac_argument_spec(),
             supports_check_mode=True
     )
     idrac = iDRAC(module)
     params = module.params
-    rc = None
-    out = ''
-    err = ''
     result = {}
 
-    # Disable insecure-certificate-warning message
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    if params['transport'] == 'requests':
+        disable_insecure_warnings()
     
     if not 'subsystem' in params.keys():
         module.fail_json(msg="You haven't specified a subsystem name")
         
-    if not 'cmd' in params.keys():
+    if not params['cmd']:
         module.fail_json(msg="You haven't specified a subsystem command")
         
-    result['subsystem'] = params['subsystem']
+    try:
+        result['subsystem'] = params['subsystem']
     
-    if params['subsystem'] == "System":
-        if params['cmd'] == 'Health':
-            
-            out = idrac.get_system_health()
-            
-        if params['cmd'] == 'SerialNumber':
-            out = idrac.get_system_serial_number()
-            
-        if params['cmd'] == 'ServiceTag':
-            out = idrac.get_system_service_tag()
-            
-        if params['cmd'] == 'AssetTag':
-            out = idrac.get_boot_sources()
-            
-        if params['cmd'] == 'Manufacturer':
-            out = idrac.get_system_Manufacturer()
-            
-        if params['cmd'] == 'BiosVersion':
-            out = idrac.get_system_bios_version()
-            
-        if params['cmd'] == 'SystemType':
-            out = idrac.get_system_type()
-            
-        if params['cmd'] == 'PowerState':
-            out = idrac.get_system_power_state()
-            
-        if params['cmd'] == 'MemoryHealth':
-            out = idrac.get_system_memory_health()
-            
-        if params['cmd'] == 'TotalSystemMemoryGiB':
-            out = idrac.get_system_memory_in_GB()
-            
-        if params['cmd'] == 'ProcessorCount':
-            out = idrac.get_processor_count()
-            
-        if params['cmd'] == 'ProcessorHealth':
-            out = idrac.get_processor_health()
-            
-        if params['cmd'] == 'ProcessorModel':
-            out = idrac.get_processor_model()
-            
-        if params['cmd'] == 'BootSources':
-            out = idrac.get_boot_sources()
-            
-        if params['cmd'] == 'EthernetInterfaces':
-            out = idrac.get_system_ethernet_interfaces()
-            
-        if params['cmd'] == 'PermanentMACAddress':
-            out = idrac.get_system_ethernet_permanent_MAC_address()
-            
-        if params['cmd'] == 'SecureBoot':
-            out = idrac.get_system_secure_boot_status()
-            
-        if params['cmd'] == 'SecureBootCerts':
-            out = idrac.get_system_secure_boot_certificates()
-            
-        if params['cmd'] == 'StorageControllers':
-            out = idrac.get_system_storage_controllers()
-            
-        if params['cmd'] == 'StorageControllerDisks':
-            out = idrac.get_system_storage_controller_disks()
-        if params['cmd'] == 'CPUs':
-            (out,err)=idrac.get_system_cpus()
-        if params['cmd'] == 'Reset':
-            if params['ResetType'] != None:
-                resp=idrac.system_reset()
-                if resp == '204':
-                    rc=resp
-                    out='OK'
-                else:
-                    err="system reset failed. Error code:%s"%(resp)
-            else:
-                module.fail_json(msg="Please provide type of reset")
-                   
-        if params['cmd'] == 'OneTimeBoot':
-            if params['Target'] != None:
-                resp=idrac.system_onetime()
-                if resp == '200':
-                    rc=resp
-                    out='OK'
-                else:
-                    err="system OneTimeBoot setting failed. Error code:%s"%(resp)
-            else:
-                module.fail_json(msg="Please provide Target name for oneTimeBoot")
-            
-    if params['subsystem'] == "Manager":
-        if params['cmd'] == 'Health':
-            out = idrac.get_manager_health()
-            
-        if params['cmd'] == 'ResetOptions':
-            out = idrac.get_manager_reset_options()
-            
-        if params['cmd'] == 'CommandShells':
-            out = idrac.get_manager_command_shells()
-            
-        if params['cmd'] == 'EthernetInterfaces':
-            out = idrac.get_manager_ethernet_interfaces()
-            
-        if params['cmd'] == 'FirmwareVersion':
-            out = idrac.get_manager_firmware()
-            
-        if params['cmd'] == 'GraphicalConsole':
-            out = idrac.get_manager_graphical_console()
-            
-        if params['cmd'] == 'SELLogs':
-            out = idrac.get_manager_sel_log()
-            
-        if params['cmd'] == 'LCLogs':
-            out = idrac.get_manager_lc_log()
-            
-        if params['cmd'] == 'Jobs':
-            out = idrac.get_manager_jobs()
-        if params['cmd'] == 'Reset':
-            if params['ResetType'] != None:
-                resp=idrac.manager_reset()
-                if resp == '204':
-                    rc=resp
-                    out='OK'
-                else:
-                    err="Manager reset failed. Error code:%s"%(resp)
-            else:
-                module.fail_json(msg="Please provide type of reset")
+        (changed, outs, errs) = run_commands(module, idrac, params['cmd'])
+        if params['snapshot_dir']:
+            (delta, outs) = report_changes(module, outs, errs)
+            changed = changed or delta
+        if params['output'] == 'structured':
+            out = err = None
+            result['data'] = outs
+            if errs:
+                result['errors'] = errs
+            if params['compress_threshold'] is not None:
+                for key in list(outs):
+                    if len(json.dumps(outs[key])) > params['compress_threshold']:
+                        result.setdefault('data_gzip', {})[key] = _compress(outs.pop(key))
+        elif len(params['cmd']) == 1 and params['all_members'] and params['subsystem'] in SUBSYSTEM_MEMBERS:
+            cmd = params['cmd'][0]
+            out = dict((member, o[cmd]) for (member, o) in outs.items() if cmd in o)
+            err = dict((member, e[cmd]) for (member, e) in errs.items() if cmd in e)
+        elif len(params['cmd']) == 1:
+            out = outs.get(params['cmd'][0], '')
+            err = errs.get(params['cmd'][0], '')
+        else:
+            out = outs
+            err = errs
 
-    if params['subsystem'] == "Chassis":
-        if params['cmd'] == 'IndicatorLED':
-            (out,err)=idrac.get_chassis_indicator_LED_status()
-            
-        if params['cmd'] == 'ChassisType':
-            (out,err)=idrac.get_chassis_type()
-        
-        if params['cmd'] == 'ResetTypes':
-            (out,err)=idrac.get_chassis_reset_options()
-            
-        if params['cmd'] == 'CooledBy':
-            (out,err)=idrac.get_chassis_fans()
-            
-        if params['cmd'] == 'Health':
-            (out,err)=idrac.get_chassis_health()
-        
-        if params['cmd'] == 'PoweredBy':
-            (out,err)=idrac.get_chassis_powered_by()
-        
-        if params['cmd'] == 'PartNumber':
-            (out,err)=idrac.get_chassis_part_number()
-            
-        if params['cmd'] == 'Model':
-            (out,err)=idrac.get_chassis_model()
-            
-        if params['cmd'] == 'Manufacturer':
-            (out,err)=idrac.get_chassis_manufacturer()
-        
-        if params['cmd'] == 'PowerState':
-            (out,err)=idrac.get_chassis_power_state()
-        if params['cmd'] == 'SKU':
-            (out,err)=idrac.get_chassis_SKU()
-        
-        if params['cmd'] == 'BoardInletTemp':
-            (out,err)=idrac.get_chassis_board_inlet_Temp()
-            
-        if params['cmd'] == 'BoardExhaustTemp':
-            (out,err)=idrac.get_chassis_board_exhaust_temp()
-            
-        if params['cmd'] == 'CPUTemp':
-            (out,err)=idrac.get_chassis_cpu_temp()
-        
-        if params['cmd'] == 'PowerConsumedWatts':
-            (out,err)=idrac.get_chassis_power_consumed_watts()
+        result['changed'] = changed
+        result['requests'] = idrac.request_count
+        if params['timings']:
+            result['timings'] = idrac.timings
+        if out:
+            result['stdout'] = out
+        if err:
+            result['stderr'] = err
         
-        if params['cmd'] == 'FANRPM':
-            (out,err)=idrac.get_chassis_fan_rpm()
-              
-    if params['subsystem'] == "Event":
-        if params['cmd'] == 'types':
-            out = idrac.get_event_type_for_subscription()
-            
-        if params['cmd'] == 'health':
-            out = idrac.get_event_service_health()
-            
-        if params['cmd'] == 'state':
-            out = idrac.get_event_state()
-            
-    if params['subsystem'] == "Session":
-        if params['cmd'] == 'id':
-            out = idrac.get_session_id()
-            
-    if params['subsystem'] == "FW":  
-        if params['cmd'] == 'FirmwareInventory':
-            out = idrac.get_firmware_inventory()
-    if rc is None:
-        result['changed'] = False
-    else:
-        result['changed'] = True
-    if out:
-        result['stdout'] = out
-    if err:
-        result['stderr'] = err
-        
-    module.exit_json(**result)
+        module.exit_json(**result)
+    finally:
+        idrac.close()
 
 if __name__ == '__main__':
     main()
-    
-    
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# The simulator in contrib/redfish_mock.py, served over HTTPS with a
+# certificate made by openssl, for the tests that drive the iDRAC class
+# against it. Its certificate is self-signed, as an iDRAC's usually is.
+
+import os
+import sys
+import argparse
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'contrib'))
+import idrac_bench
+import redfish_mock
+
+
+def bench_args(workdir, *argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--workdir')
+    redfish_mock.add_fixture_arguments(parser)
+    return parser.parse_args(['--workdir', workdir] + list(argv))
+
+
+@pytest.fixture(scope='session')
+def args(tmp_path_factory):
+    workdir = str(tmp_path_factory.mktemp('bench'))
+    args = bench_args(workdir)
+    try:
+        (args.certfile, args.keyfile) = idrac_bench.make_certificate(workdir)
+    except (OSError, IOError) as e:
+        pytest.skip("openssl is needed for the simulator's certificate: %s" % e)
+    return args
+
+
+@pytest.fixture(scope='session')
+def server(args):
+    server = redfish_mock.server_from_args(args, ('127.0.0.1', 0)).start()
+    yield server
+    server.stop()
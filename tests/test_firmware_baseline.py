@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# FW Compliance against a Dell catalog that lists several PowerEdge models:
+# only the entries of the host's model may count.
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+
+pytestmark = pytest.mark.filterwarnings('ignore:Unverified HTTPS request')
+
+COMPONENT = '''
+  <SoftwareComponent vendorVersion="%(version)s" dellVersion="%(version)s">
+    <Name><Display lang="en">%(name)s</Display></Name>
+    <SupportedDevices><Device componentID="%(component)s" embedded="1"/></SupportedDevices>
+    %(systems)s
+  </SoftwareComponent>'''
+
+MODEL = ('<SupportedSystems><Brand key="3" prefix="PE">'
+         '<Model systemID="%s" systemIDType="BIOS"><Display>%s</Display></Model></Brand></SupportedSystems>')
+
+
+def write_catalog(path, components):
+    # components: (componentID, version, name, [(systemID, model), ...])
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<Manifest>')
+        for (component, version, name, models) in components:
+            systems = ''.join(MODEL % model for model in models)
+            f.write(COMPONENT % {'component': component, 'version': version, 'name': name, 'systems': systems})
+        f.write('\n</Manifest>\n')
+    return path
+
+
+def test_catalog_keeps_each_models_version(tmp_path):
+    path = write_catalog(str(tmp_path / 'Catalog.xml'), [
+        ('159', '2.19.1', 'BIOS', [('0716', 'R640')]),
+        ('159', '1.12.2', 'BIOS', [('0b1c', 'R750')]),
+        ('25227', '7.00.00.00', 'iDRAC', []),
+    ])
+    index = idrac._read_catalog(path)
+    assert index['0716']['159']['Version'] == '2.19.1'
+    assert index['0B1C']['159']['Version'] == '1.12.2'
+    assert idrac._baseline_for(index, '0B1C') == {'159': {'Version': '1.12.2', 'Name': 'BIOS'},
+                                                  '25227': {'Version': '7.00.00.00', 'Name': 'iDRAC'}}
+    # An unknown model only gets the entries of no particular model
+    assert list(idrac._baseline_for(index, None)) == ['25227']
+
+
+def test_compliance_ignores_other_models(server, tmp_path):
+    # The simulated R740 (SystemID 0715) has 25000 at 1.0.0, 25001 at 2.1.1
+    # and 25002 at 3.2.2
+    path = write_catalog(str(tmp_path / 'Catalog.xml'), [
+        ('25000', '1.0.0', 'Component 0', [('0715', 'R740')]),
+        ('25000', '9.9.9', 'Component 0', [('0716', 'R640')]),
+        ('25001', '9.9.9', 'Component 1', [('0716', 'R640')]),
+        ('25002', '3.3.0', 'Component 2', [('0715', 'R740'), ('0716', 'R640')]),
+    ])
+    module = idrac.StandaloneModule(idracip='127.0.0.1:%d' % server.server_address[1],
+                                    subsystem='FW', cmd=['Compliance'], baseline=path)
+    client = idrac.iDRAC(module)
+    try:
+        (changed, outs, errs) = idrac.run_commands(module, client, ['Compliance'])
+    finally:
+        client.close()
+    assert not errs
+    assert json.loads(outs['Compliance']) == {
+        'Installed-25002-3.2.2': {'Name': 'Component 2', 'SoftwareId': '25002', 'Installed': '3.2.2',
+                                  'Baseline': '3.3.0', 'Status': 'Older'}}
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+# The streaming parser behind log pages and $expand'ed collections must give
+# the same members wherever the response is cut into chunks.
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import idrac
+
+DOC = {'@odata.id': '/redfish/v1/x', 'Members@odata.count': 7,
+       'Members': [{'Id': '1', 'Message': u'h\xe9llo ☃', 'Reading': 276.5}, 276.5, -1.5e10, 12, True, None, []],
+       'Members@odata.nextLink': '/redfish/v1/x?$skip=7'}
+
+
+@pytest.mark.parametrize('chunks,members', [
+    ([b'{"Members": [276.', b'5]}'], [276.5]),
+    ([b'{"Members": [1e', b'5, -', b'2.5E', b'-3]}'], [1e5, -2.5e-3]),
+    ([b'{"Members": [12', b'34, 5', b'6]}'], [1234, 56]),
+])
+def test_number_split_across_chunks(chunks, members):
+    assert list(idrac._iter_json_members(chunks)) == members
+
+
+def test_every_cut_gives_the_same_members():
+    raw = json.dumps(DOC, ensure_ascii=False).encode('utf-8')
+    tail = dict(DOC)
+    members = tail.pop('Members')
+    for size in (1, 2, 3, 7, 64):
+        got = {}
+        chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+        assert list(idrac._iter_json_members(chunks, tail=got)) == members
+        assert got == tail
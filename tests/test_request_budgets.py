@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Request budgets of the iDRAC class against the simulator in
+# contrib/redfish_mock.py, so round-trip regressions fail the tests:
+#
+#   python -m pytest -q tests
+
+import os
+import sys
+import math
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'contrib'))
+import idrac_bench
+
+idrac = idrac_bench.idrac
+
+pytestmark = pytest.mark.filterwarnings('ignore:Unverified HTTPS request')
+
+
+def run(server, subsystem, cmds, **extra):
+    # One module invocation; returns its outs and the requests it sent
+    module = idrac.StandaloneModule(idracip='127.0.0.1:%d' % server.server_address[1],
+                                    subsystem=subsystem, cmd=cmds, **extra)
+    client = idrac.iDRAC(module)
+    try:
+        (changed, outs, errs) = idrac.run_commands(module, client, cmds)
+    finally:
+        client.close()
+    assert not errs
+    return (outs, client.request_count)
+
+
+def test_scenarios_within_budget(server, args):
+    for (name, subsystem, cmds, extra, budget) in idrac_bench.scenarios(args):
+        result = idrac_bench.run_scenario(server, name, subsystem, cmds, extra, budget, 1)
+        assert result['requests'] <= budget, result
+
+
+def test_system_batch_is_one_request(server):
+    (outs, requests) = run(server, 'System', idrac_bench.SYSTEM_BATCH)
+    assert sorted(outs) == sorted(idrac_bench.SYSTEM_BATCH)
+    assert requests == 1
+
+
+def test_snapshot_rerun_is_one_request(server, tmp_path):
+    snapshot_dir = str(tmp_path / 'snapshot')
+    run(server, 'System', idrac_bench.SYSTEM_BATCH, snapshot_dir=snapshot_dir)
+    # Service root from the cache, the System revalidated with a 304
+    (outs, requests) = run(server, 'System', idrac_bench.SYSTEM_BATCH, snapshot_dir=snapshot_dir)
+    assert requests == 1
+
+
+def test_log_cursor_rerun_is_one_request(server, args, tmp_path):
+    log = dict(log_cursor=str(tmp_path / 'cursor.json'), log_dest=str(tmp_path / 'lclog.ndjson'))
+    (outs, requests) = run(server, 'Manager', ['LCLogs'], **log)
+    assert requests == int(math.ceil(float(args.lclog) / args.page_size))
+    # Newest-first, so the first page already reaches the cursor
+    (outs, requests) = run(server, 'Manager', ['LCLogs'], **log)
+    assert requests == 1
+    assert '"entries": 0' in outs['LCLogs']
+
+
+def test_log_check_mode_writes_nothing(server, args, tmp_path):
+    cursor = tmp_path / 'cursor.json'
+    dest = tmp_path / 'lclog.ndjson'
+    module = idrac.StandaloneModule(idracip='127.0.0.1:%d' % server.server_address[1], subsystem='Manager',
+                                    cmd=['LCLogs'], log_cursor=str(cursor), log_dest=str(dest))
+    module.check_mode = True
+    client = idrac.iDRAC(module)
+    try:
+        (changed, outs, errs) = idrac.run_commands(module, client, ['LCLogs'])
+    finally:
+        client.close()
+    assert '"entries": %d' % args.lclog in outs['LCLogs']
+    assert not cursor.exists() and not dest.exists()
+
+
+def test_log_top_is_one_request(server):
+    (outs, requests) = run(server, 'Manager', ['LCLogs'], log_top=5, output='structured')
+    assert len(outs['LCLogs']) == 5
+    assert requests == 1
+
+
+@pytest.mark.parametrize('transport', ['requests', 'http.client'])
+def test_second_client_resumes_tls(server, tmp_path, transport):
+    result = idrac_bench.run_handshakes(server, transport, 2, str(tmp_path))
+    assert result['full_resumed'] == 0
+    assert result['resumed_resumed'] == 2